@@ -4,10 +4,8 @@ Script for combining audio files using their transcript files with start/stop ti
 """
 import argparse
 import logging
-import operator
 import os
 import sys
-from functools import reduce
 
 from asrtoolkit.data_structures.audio_file import audio_file, combine_audio
 from asrtoolkit.data_structures.time_aligned_text import time_aligned_text
@@ -45,7 +43,7 @@ def check_transcript_segment(segment):
 
 def combine_transcripts(transcripts, output_file_name):
     # Get one list of segments
-    out_transcript = reduce(operator.add, transcripts)
+    out_transcript = time_aligned_text.merge(*transcripts)
     out_transcript.location = os.path.join(
         strip_extension(output_file_name) + "." + out_transcript.file_extension
     )
@@ -60,7 +58,7 @@ def main():
         description="""Combine audio files using segments from their transcript files. For this utility, transcript files must contain start/stop times.
            Lists of transcripts and audio files must be ordered identically, meaning the first audio file's
            transcript is the first transcript.
-           Note: transcripts from each file are not checked for overlapping time intervals when they are combined and sorted.
+           Note: overlapping time intervals between transcripts are logged as a warning but are kept when they are combined and sorted.
         """
     )
     parser.add_argument(
@@ -4,11 +4,18 @@ Python class for converting file formats used in Automatic Speech Recognition
 """
 
 import logging
+import os
 import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
 from fire import Fire
 
-from asrtoolkit.file_utils.script_input_validation import assign_if_valid
+from asrtoolkit.file_utils.name_cleaners import sanitize_hyphens, strip_extension
+from asrtoolkit.file_utils.script_input_validation import (
+    assign_if_valid,
+    valid_input_file,
+)
 
 LOGGER = logging.getLogger(__name__)
 
@@ -21,7 +28,7 @@ def check_input_file_validity(input_file):
 
 def convert(input_file, output_file):
     """
-    Convert between text file formats (supported formats are stm, json, srt, vtt, txt, and html)
+    Convert between text file formats (supported formats are stm, json, srt, vtt, txt, html, and tat)
 
     Validates lines of transcript before writing new file.
     STM files are unformatted (eg 10 -> ten)
@@ -31,8 +38,133 @@ def convert(input_file, output_file):
     input_file.write(output_file)
 
 
+def convert_one(input_file, output_file):
+    """
+    Convert a single file as part of a bulk conversion
+    Returns 'converted' or 'failed'
+    """
+    try:
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        assign_if_valid(input_file).write(output_file)
+        return "converted"
+    except Exception as exc:
+        LOGGER.exception("Could not convert %s: %s", input_file, exc)
+        return "failed"
+
+
+def is_within(path, directory):
+    " Returns True if path is directory or inside it "
+    path, directory = os.path.abspath(path), os.path.abspath(directory)
+    return os.path.commonpath([path, directory]) == directory
+
+
+def find_conversions(input_dir, output_dir, output_format):
+    """
+    Walk input_dir and yield (input_file, output_file, status) for each transcript
+    where status is
+        'convert' if the output is missing or older than the input
+        'skipped' if the output is up to date
+        'collided' if the output is an input transcript
+          or the output of an earlier input with the same name
+    output_dir is not searched if it is inside input_dir, so outputs are not converted again
+    """
+    outputs = set()
+    for root, dirs, files in os.walk(input_dir):
+        dirs[:] = sorted(
+            _
+            for _ in dirs
+            if is_within(input_dir, output_dir)
+            or not is_within(os.path.join(root, _), output_dir)
+        )
+        for file_name in sorted(files):
+            input_file = os.path.join(root, file_name)
+            if not valid_input_file(input_file):
+                continue
+            output_file = sanitize_hyphens(
+                os.path.join(
+                    output_dir,
+                    os.path.relpath(strip_extension(input_file), input_dir)
+                    + "."
+                    + output_format,
+                )
+            )
+            if os.path.abspath(output_file) in outputs or (
+                is_within(output_file, input_dir)
+                and not is_within(output_file, output_dir)
+                and valid_input_file(output_file)
+            ):
+                LOGGER.error(
+                    "Not converting %s since %s is an input or another output",
+                    input_file,
+                    output_file,
+                )
+                yield input_file, output_file, "collided"
+                continue
+            outputs.add(os.path.abspath(output_file))
+            if os.path.exists(output_file) and os.path.getmtime(
+                output_file
+            ) >= os.path.getmtime(input_file):
+                yield input_file, output_file, "skipped"
+            else:
+                yield input_file, output_file, "convert"
+
+
+def convert_directory(input_dir, output_dir, output_format="stm", jobs=None):
+    """
+    Convert all transcripts under input_dir to output_format using a pool of jobs processes
+    Mirrors the directory layout in output_dir, which must differ from input_dir
+    Skips outputs newer than their inputs
+    and inputs whose output would overwrite an input or another output
+    Returns a count of converted, skipped, failed, and collided files
+    """
+    if os.path.abspath(output_dir) == os.path.abspath(input_dir):
+        raise ValueError("Output directory must differ from input directory")
+    summary = Counter(converted=0, skipped=0, failed=0, collided=0)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = []
+        for input_file, output_file, status in find_conversions(
+            input_dir, output_dir, output_format
+        ):
+            if status == "convert":
+                futures.append(executor.submit(convert_one, input_file, output_file))
+            else:
+                summary[status] += 1
+        summary.update(future.result() for future in futures)
+
+    print(
+        "Converted {converted} files, skipped {skipped} up-to-date files, "
+        "{failed} failed, {collided} collided with other files".format(**summary)
+    )
+    return dict(summary)
+
+
+def convert_transcript(
+    input_file=None,
+    output_file=None,
+    input_dir=None,
+    output_dir=None,
+    output_format="stm",
+    jobs=None,
+):
+    """
+    Convert between text file formats (supported formats are stm, json, srt, vtt, txt, html, and tat)
+
+    Either convert input_file to output_file
+    or, given --input-dir, convert every transcript under it to --output-format
+    using --jobs processes, mirroring the layout in --output-dir
+    """
+    if input_dir is not None:
+        if output_dir is None:
+            LOGGER.error("An output directory is required to convert a directory")
+            sys.exit(1)
+        convert_directory(input_dir, output_dir, output_format, jobs)
+    else:
+        convert(input_file, output_file)
+
+
 def cli():
-    Fire(convert)
+    Fire(convert_transcript)
 
 
 if __name__ == "__main__":
@@ -6,6 +6,9 @@ Note that the structure may change without notice and break backwards compatibil
 This expects a segment from class derived in convert_text
 """
 
+import re
+from html import unescape
+
 from bs4 import BeautifulSoup
 
 # do not delete - needed in time_aligned_text
@@ -13,6 +16,14 @@ from asrtoolkit.data_handlers.data_handlers_common import separator
 from asrtoolkit.data_structures.segment import segment
 
 
+# matches one row of the table layout written by format_segment below
+asrtoolkit_row = re.compile(
+    r'<tr><td align="left">\[(?P<start>[^\]<]*) - (?P<stop>[^\]<]*)\]</td>'
+    r'<td align="left">(?P<speaker>[^<]*)</td>'
+    r'<td align="left">(?P<text>[^<]*)</td></tr>'
+)
+
+
 def table_header(text, width):
     " make a table header with input width "
     return '<th align="left" width="{:}%">{:}</th>'.format(width, text)
@@ -77,14 +88,47 @@ def parse_line(line):
     return seg
 
 
+def parse_match(match):
+    " parse a single row matched by the asrtoolkit_row pattern "
+    seg = segment(
+        {key: unescape(val) for key, val in match.groupdict().items() if val}
+    )
+    return seg if seg.validate() else None
+
+
+def read_asrtoolkit_html(input_data):
+    """
+    Fast path for tables written by asrtoolkit
+    Returns None if input_data does not strictly follow that layout
+    >>> read_asrtoolkit_html(header() + footer())
+    []
+    >>> read_asrtoolkit_html("<table><tr><td>foreign</td></tr></table>") is None
+    True
+    """
+    if not input_data.startswith(header()):
+        return None
+
+    matches = list(asrtoolkit_row.finditer(input_data))
+    if len(matches) != input_data.count("<tr><td"):
+        return None
+
+    return [_ for _ in map(parse_match, matches) if _]
+
+
 def read_file(file_name):
     """
     Reads an HTML file, skipping any gap lines
+    Uses BeautifulSoup only for tables not written by asrtoolkit
     """
-    soup = BeautifulSoup(open(file_name).read(), "html.parser")
-    table = soup.find("table", {})
+    with open(file_name, encoding="utf-8") as f:
+        input_data = f.read()
+
+    segments = read_asrtoolkit_html(input_data)
+    if segments is None:
+        soup = BeautifulSoup(input_data, "html.parser")
+        table = soup.find("table", {})
 
-    segments = [_ for _ in map(parse_line, table.findAll("tr")) if _]
+        segments = [_ for _ in map(parse_line, table.findAll("tr")) if _]
 
     return segments
 
@@ -25,42 +25,144 @@ conf is the confidence (probability) that the object information is correct. If
 
 """
 
+import operator
+from array import array
+from itertools import compress
+
 # do not delete - needed for time_aligned_text
 from asrtoolkit.data_handlers.data_handlers_common import footer, separator
+from asrtoolkit.data_structures.formatting import std_float
 from asrtoolkit.data_structures.segment import segment
-from asrtoolkit.data_structures.formatting import clean_float
+
+N_FIELDS = 10
+RTTM_TYPES = {
+    "SEGMENT",
+    "NOSCORE",
+    "NO_RT_METADATA",
+    "LEXEME",
+    "NON-LEX",
+    "NON-SPEECH",
+    "FILLER",
+    "EDIT",
+    "IP",
+    "END-of-SU",
+    "SU",
+    "CB",
+    "A/P",
+    "SPEAKER",
+    "SPKR-INFO",
+}
+
 
 def header():
     "Header for rttm files is empty"
     return ""
 
 
+def decimals(value):
+    """
+    Returns the number of digits after the decimal point in a number's text
+    >>> decimals("1.250"), decimals(3)
+    (3, 0)
+    """
+    text = str(value)
+    return len(text) - text.index(".") - 1 if "." in text else 0
+
+
 def format_segment(seg):
     """
     Formats a segment assuming it's an instance of class segment with elements
     filename, channel, speaker, start and stop times, label, and text
+    Durations keep the precision of the start and stop times, with at least 2 decimals
+    """
+    duration = std_float(
+        float(seg.stop) - float(seg.start),
+        max(2, decimals(seg.start), decimals(seg.stop)),
+    )
+    return f"SPEAKER {seg.filename} {seg.channel} {seg.start} {duration} <NA> <NA> {seg.speaker} <NA> <NA>"
+
+
+def format_segments(segments):
+    """
+    Formats all segments as RTTM lines with a single join
+    """
+    return separator.join(map(format_segment, segments))
+
+
+def split_rows(input_data):
+    """
+    Returns list of fields for each RTTM line
+    Splits the whole file at once when every line has the standard 10 fields
+    >>> split_rows("SPEAKER a 1 0.5 1.5 <NA> <NA> spk <NA> <NA>\\n")[7]
+    ['spk']
+    """
+    tokens = input_data.split()
+    types = tokens[::N_FIELDS]
+    if len(tokens) % N_FIELDS == 0 and RTTM_TYPES.issuperset(types):
+        return [tokens[i::N_FIELDS] for i in range(N_FIELDS)]
+
+    # fall back to splitting lines one by one for non-standard files
+    lines = [line.split() for line in input_data.splitlines() if line.strip()]
+    return [
+        [line[i] if i < len(line) else "<NA>" for line in lines]
+        for i in range(N_FIELDS)
+    ]
+
+
+def read_columns(file_name):
+    """
+    Reads the SPEAKER lines of an RTTM file into columns
+    Start, duration, and stop times are float arrays
+    and tbeg and tdur hold the start and duration text as written
     """
-    return f"SPEAKER {seg.filename} {seg.channel} {seg.start} {clean_float(float(seg.stop)-float(seg.start))} <NA> <NA> {seg.speaker} <NA> <NA>"
+    with open(file_name, encoding="utf-8") as f:
+        rows = split_rows(f.read())
+
+    if any(_ != "SPEAKER" for _ in rows[0]):
+        keep = [_ == "SPEAKER" for _ in rows[0]]
+        rows = [list(compress(column, keep)) for column in rows]
+
+    start = array("d", map(float, rows[3]))
+    duration = array("d", map(float, rows[4]))
+
+    return {
+        "filename": rows[1],
+        "channel": rows[2],
+        "start": start,
+        "duration": duration,
+        "stop": array("d", map(operator.add, start, duration)),
+        "speaker": rows[7],
+        "tbeg": rows[3],
+        "tdur": rows[4],
+    }
 
 
 def read_file(file_name):
-    """ Reads an RTTM file """
-
-    segments = []
-    with open(file_name) as data:
-        for line in data:
-            _, filename, channel, start, duration, _, _, speaker, _, _ = line.split()
-            seg = segment(
-                **dict(
-                    filename=filename,
-                    channel=channel,
-                    start=start,
-                    stop=start + duration,
-                    speaker=speaker,
-                )
-            )
-            segments.append(seg)
-    return segments
+    """
+    Reads an RTTM file
+    Start times are kept as written and stop times keep their precision
+    """
+    columns = read_columns(file_name)
+
+    return [
+        segment(
+            {
+                "filename": filename,
+                "channel": channel,
+                "start": tbeg,
+                "stop": std_float(stop, max(decimals(tbeg), decimals(tdur))),
+                "speaker": speaker,
+            }
+        )
+        for filename, channel, tbeg, tdur, stop, speaker in zip(
+            columns["filename"],
+            columns["channel"],
+            columns["tbeg"],
+            columns["tdur"],
+            columns["stop"],
+            columns["speaker"],
+        )
+    ]
 
 
 __all__ = [header, footer, separator]
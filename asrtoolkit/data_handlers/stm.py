@@ -7,10 +7,11 @@ Expected file format is derived from http://www1.icsi.berkeley.edu/Speech/docs/s
 This expects a segment from class derived in convert_text
 """
 
-from asrtoolkit.clean_formatting import clean_up
+from asrtoolkit.clean_formatting import check_for_formatted_chars, clean_up
 
 # leave in place for other imports
 from asrtoolkit.data_handlers.data_handlers_common import footer, header, separator
+from asrtoolkit.data_structures.lazy_segments import lazy_segments
 from asrtoolkit.data_structures.segment import segment
 
 
@@ -26,16 +27,26 @@ def format_segment(seg):
       Formats a segment assuming it's an instance of class segment with elements
       filename, channel, speaker, start and stop times, label, and text
     """
-    # clean_up used to unformat stm file text
-    return " ".join(
-        [
-            str(getattr(seg, _))
-            for _ in ("filename", "channel", "speaker", "start", "stop", "label")
-        ]
-        + [clean_up(seg.text)]
+    # clean_up used to unformat stm file text unless it is already unformatted
+    return "{} {} {} {} {} {} {}".format(
+        seg.filename,
+        seg.channel,
+        seg.speaker,
+        seg.start,
+        seg.stop,
+        seg.label,
+        seg.text if seg.normalized else clean_up(seg.text),
     )
 
 
+def format_segments(segments):
+    """
+    :param segments: iterable of segment objects
+    :return str: text for all STM lines, built with a single join
+    """
+    return separator.join(map(format_segment, segments))
+
+
 def parse_line(line):
     """
     :param line: str; a single line of an stm file
@@ -56,6 +67,8 @@ def parse_line(line):
                 "stop": stop,
                 "label": label,
                 "text": text,
+                # text split on whitespace is only unformatted if it has no special chars
+                "normalized_text": None if check_for_formatted_chars(text) else text,
             }
         )
     return seg if (seg is not None) and seg.validate() else None
@@ -75,4 +88,12 @@ def read_file(file_name):
     return segments
 
 
+def read_lazy(file_name):
+    """
+    Memory-maps an STM file, parsing each line only when it is accessed
+    :return: lazy_segments object
+    """
+    return lazy_segments(file_name, parse_line)
+
+
 __all__ = [header, footer, separator]
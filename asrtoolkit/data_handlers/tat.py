@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+Module for reading/writing TAT (time aligned text) binary files
+
+TAT files store the columns of a time_aligned_text object so that they can
+be memory-mapped and reloaded without re-parsing or re-validating text
+
+```
+header    magic, byte order, number of segments (n), number of strings (m)
+float64   start[n], stop[n], confidence[n]
+uint32    filename[n], channel[n], speaker[n], label[n] (ids into dictionary)
+uint64    string_offsets[2n + m + 1]
+utf-8     blob of text[n], formatted_text[n], dictionary[m]
+```
+
+Segments are assumed to be valid when written, so they are not re-validated
+when read. Only the attributes above are stored.
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+
+# do not delete - needed for time_aligned_text
+from asrtoolkit.data_handlers.data_handlers_common import footer, header, separator
+from asrtoolkit.data_structures.formatting import std_float
+from asrtoolkit.data_structures.segment import segment
+
+MAGIC = b"ASRTAT01"
+BYTE_ORDERS = {"little": 1, "big": 2}
+file_header = struct.Struct("<8sQQQ")
+
+FLOAT_FIELDS = ("start", "stop", "confidence")
+DICTIONARY_FIELDS = ("filename", "channel", "speaker", "label")
+TEXT_FIELDS = ("text", "formatted_text")
+
+
+def format_segment(seg):
+    """
+    Formats a segment as a space-separated line for printing
+    since TAT files are only written in bulk by write_file
+    """
+    return " ".join(
+        str(getattr(seg, _))
+        for _ in ("filename", "channel", "speaker", "start", "stop", "label", "text")
+    )
+
+
+def write_file(file_name, segments):
+    """
+    Writes segments to a TAT file in a single pass over each column
+    """
+    segments = list(segments)
+    dictionary = {}
+
+    floats = [
+        array("d", (float(getattr(seg, field)) for seg in segments))
+        for field in FLOAT_FIELDS
+    ]
+    ids = [
+        array(
+            "I",
+            (
+                dictionary.setdefault(str(getattr(seg, field)), len(dictionary))
+                for seg in segments
+            ),
+        )
+        for field in DICTIONARY_FIELDS
+    ]
+
+    strings = [
+        getattr(seg, field).encode("utf-8")
+        for field in TEXT_FIELDS
+        for seg in segments
+    ] + [_.encode("utf-8") for _ in dictionary]
+
+    offsets = array("Q", [0])
+    for string in strings:
+        offsets.append(offsets[-1] + len(string))
+
+    with open(file_name, "wb") as f:
+        f.write(
+            file_header.pack(
+                MAGIC, BYTE_ORDERS[sys.byteorder], len(segments), len(dictionary)
+            )
+        )
+        for column in floats + ids + [offsets]:
+            column.tofile(f)
+        f.write(b"".join(strings))
+
+
+def read_columns(file_name):
+    """
+    Memory-maps a TAT file and returns its columns without copying them
+    Float and id columns are memoryviews over the mapped file
+    """
+    with open(file_name, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, byte_order, n_segs, n_strings = file_header.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("{} is not a TAT file".format(file_name))
+    if byte_order != BYTE_ORDERS[sys.byteorder]:
+        raise ValueError("{} was written with a different byte order".format(file_name))
+
+    view = memoryview(data)
+    columns = {}
+    position = file_header.size
+
+    def take(typecode, length):
+        " slice the next column from the mapped file "
+        nonlocal position
+        n_bytes = length * array(typecode).itemsize
+        column = view[position : position + n_bytes].cast(typecode)
+        position += n_bytes
+        return column
+
+    for field in FLOAT_FIELDS:
+        columns[field] = take("d", n_segs)
+    for field in DICTIONARY_FIELDS:
+        columns[field] = take("I", n_segs)
+
+    columns["string_offsets"] = take("Q", 2 * n_segs + n_strings + 1)
+    columns["blob"] = view[position:]
+    columns["n_segments"] = n_segs
+    columns["n_strings"] = n_strings
+
+    return columns
+
+
+def read_file(file_name):
+    """
+    Reads a TAT file
+    :return: list of segment objects
+    """
+    columns = read_columns(file_name)
+    n_segs = columns["n_segments"]
+    offsets = columns["string_offsets"]
+    blob = columns["blob"]
+
+    strings = [
+        str(blob[offsets[i] : offsets[i + 1]], "utf-8") for i in range(len(offsets) - 1)
+    ]
+    dictionary = strings[2 * n_segs :]
+
+    segments = []
+    for i in range(n_segs):
+        seg = segment()
+        seg.start = std_float(columns["start"][i])
+        seg.stop = std_float(columns["stop"][i])
+        seg.confidence = columns["confidence"][i]
+        for field in DICTIONARY_FIELDS:
+            setattr(seg, field, dictionary[columns[field][i]])
+        seg.text = strings[i]
+        seg.formatted_text = strings[n_segs + i]
+        segments.append(seg)
+
+    return segments
+
+
+__all__ = [header, footer, separator]
@@ -8,6 +8,15 @@ import logging
 import os
 import subprocess
 
+from asrtoolkit.file_utils.common_file_operations import hash_file
+from asrtoolkit.file_utils.pcm_files import (
+    SAMPLE_WIDTH,
+    can_write,
+    is_training_pcm,
+    map_pcm,
+    read_header,
+    write_pcm,
+)
 from asrtoolkit.file_utils.name_cleaners import (
     generate_segmented_file_name,
     sanitize_hyphens,
@@ -17,6 +26,12 @@ from asrtoolkit.file_utils.script_input_validation import valid_input_file
 
 LOGGER = logging.getLogger()
 
+# bytes read at a time from sox when decoding audio
+DECODE_CHUNK_SIZE = 1 << 16
+
+# sox options describing 16 bit little-endian mono PCM
+RAW_PCM_OPTIONS = "-t raw -r {} -b 16 -c 1 -e signed-integer -L"
+
 
 def cut_utterance(
     source_audio_file, target_audio_file, start_time, end_time, sample_rate=16000
@@ -31,7 +46,16 @@ def cut_utterance(
     uses sox to segment source_audio_file to create target_audio_file that
     contains audio from start_time to end_time
         with audio sample rate set to sample_rate
+    unless both are WAV or SPH files and no resampling or conversion is needed
     """
+    if can_write(target_audio_file) and is_training_pcm(
+        read_header(source_audio_file), sample_rate
+    ):
+        cut_utterances(
+            source_audio_file, [(target_audio_file, start_time, end_time)], sample_rate
+        )
+        return
+
     subprocess.call(
         "sox -V1 {} -r {} -b 16 -c 1 {} trim {} ={}".format(
             source_audio_file,
@@ -44,6 +68,132 @@ def cut_utterance(
     )
 
 
+def decode_pcm(source_audio_file, sample_rate=16000):
+    """
+    Decodes an audio file once with a single sox process
+    Yields chunks of 16 bit little-endian mono PCM bytes at sample_rate
+    """
+    process = subprocess.Popen(
+        "sox -V1 {} {} -".format(
+            source_audio_file, RAW_PCM_OPTIONS.format(sample_rate)
+        ),
+        shell=True,
+        stdout=subprocess.PIPE,
+    )
+    try:
+        yield from iter(lambda: process.stdout.read(DECODE_CHUNK_SIZE), b"")
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+
+def slice_pcm(chunks, spans):
+    """
+    Yields the bytes of each (start, end) byte span of a stream of chunks
+    Spans must be sorted by start and may overlap
+    Bytes are only held from the start of the current span,
+    so memory is bounded by the longest span rather than the stream
+
+    >>> list(slice_pcm(iter([b"abc", b"def", b"gh"]), [(1, 4), (2, 3), (6, 10)]))
+    [b'bcd', b'c', b'gh']
+    """
+    buffer, base = bytearray(), 0
+    for start, end in spans:
+        # drop bytes before this span, and skip any not yet read
+        drop = min(max(start - base, 0), len(buffer))
+        del buffer[:drop]
+        base += drop
+        while base + len(buffer) < end:
+            chunk = next(chunks, b"")
+            if not chunk:
+                break
+            buffer += chunk
+            if base < start:
+                drop = min(start - base, len(buffer))
+                del buffer[:drop]
+                base += drop
+        yield bytes(buffer[max(start - base, 0) : max(end - base, 0)])
+
+
+def write_segment(target_audio_file, pcm, sample_rate=16000):
+    """
+    Writes 16 bit mono PCM bytes to target_audio_file
+    WAV and SPH files are written directly, and other formats are encoded by sox
+    """
+    if can_write(target_audio_file):
+        write_pcm(target_audio_file, pcm, sample_rate)
+    else:
+        subprocess.run(
+            "sox -V1 {} - {}".format(
+                RAW_PCM_OPTIONS.format(sample_rate), target_audio_file
+            ),
+            shell=True,
+            input=pcm,
+        )
+
+
+def cut_utterances(source_audio_file, cuts, sample_rate=16000):
+    """
+    source_audio_file: str, path to file
+    cuts: iterable of (target_audio_file, start_time, end_time)
+    sample_rate: int, default 16000; audio sample rate in Hz
+
+    decodes source_audio_file once with sox and writes each target_audio_file
+    with audio from its start_time to end_time
+        with audio sample rate set to sample_rate
+    WAV and SPH files already of 16 bit mono PCM at sample_rate are memory-mapped
+    and cut without sox
+    """
+    cuts = sorted(
+        (
+            round(float(start_time) * sample_rate) * SAMPLE_WIDTH,
+            round(float(end_time) * sample_rate) * SAMPLE_WIDTH,
+            target_audio_file,
+        )
+        for target_audio_file, start_time, end_time in cuts
+    )
+    header = read_header(source_audio_file)
+    if is_training_pcm(header, sample_rate):
+        # slice memory-mapped PCM data without decoding or copying it
+        with map_pcm(source_audio_file, header) as data:
+            write_cuts(
+                source_audio_file,
+                cuts,
+                (data[start:end] for start, end, _ in cuts),
+                sample_rate,
+            )
+        return
+
+    chunks = decode_pcm(source_audio_file, sample_rate)
+    try:
+        write_cuts(
+            source_audio_file,
+            cuts,
+            slice_pcm(chunks, [(start, end) for start, end, _ in cuts]),
+            sample_rate,
+        )
+    finally:
+        chunks.close()
+
+
+def write_cuts(source_audio_file, cuts, segments, sample_rate=16000):
+    """
+    Writes the PCM bytes of each segment to the target of each (start, end, target) cut
+    """
+    bytes_per_second = sample_rate * SAMPLE_WIDTH
+    for (start, end, target_audio_file), pcm in zip(cuts, segments):
+        if not pcm:
+            LOGGER.warning(
+                "No audio decoded from %s between %.2f and %.2f seconds",
+                source_audio_file,
+                start / bytes_per_second,
+                end / bytes_per_second,
+            )
+            continue
+        write_segment(target_audio_file, pcm, sample_rate)
+
+
 def degrade_audio(source_audio_file, target_audio_file=None):
     """
     Degrades audio to typical G711 level.
@@ -112,21 +262,25 @@ class audio_file(object):
             raise FileNotFoundError('Could not find file at "{}"'.format(location))
         self.location = location
 
-    def hash(self):
+    def hash(self, sidecar=False):
         """
         Returns a sha1 hash of the file
+        computed at most once for each version of the file
+        If 'sidecar' is True, the hash persists in a .sha1 file next to the audio
         """
         if self.location:
-            with open(self.location, "rb") as f:
-                return hashlib.sha1(f.read()).hexdigest()
+            return hash_file(self.location, sidecar=sidecar)
         else:
             return hashlib.sha1("".encode()).hexdigest()
 
-    def prepare_for_training(self, file_name, sample_rate=16000):
+    def prepare_for_training(self, file_name, sample_rate=16000, timeout=None):
         """
         Converts to single channel (from channel 1) audio file
         in SPH file format
+        WAV and SPH files already of 16 bit mono PCM at sample_rate are copied without sox
         Returns audio_file object on success, else None
+        If sox runs for more than timeout seconds it is killed
+        and subprocess.TimeoutExpired is raised
         """
         if file_name.split(".")[-1] != "sph":
             LOGGER.warning(
@@ -136,6 +290,14 @@ class audio_file(object):
 
         file_name = sanitize_hyphens(file_name)
 
+        # audio already in training format is copied without sox
+        header = read_header(self.location)
+        if is_training_pcm(header, sample_rate):
+            if os.path.realpath(file_name) != os.path.realpath(self.location):
+                with map_pcm(self.location, header) as data:
+                    write_pcm(file_name, data, sample_rate)
+            return audio_file(file_name)
+
         # return None if error code given, otherwise return audio_file object
         output_file = (
             audio_file(file_name)
@@ -144,6 +306,7 @@ class audio_file(object):
                     self.location, file_name, sample_rate
                 ),
                 shell=True,
+                timeout=timeout,
             )
             else None
         )
@@ -154,16 +317,21 @@ class audio_file(object):
         """
         Split audio file and transcript into many pieces based on
         valid segments of transcript
+        The audio file is decoded once for all segments
         """
 
         os.makedirs(target_dir, exist_ok=True)
-        for iseg, seg in enumerate(transcript.segments):
-            cut_utterance(
-                self.location,
-                generate_segmented_file_name(target_dir, self.location, iseg),
-                seg.start,
-                seg.stop,
-            )
+        cut_utterances(
+            self.location,
+            (
+                (
+                    generate_segmented_file_name(target_dir, self.location, iseg),
+                    seg.start,
+                    seg.stop,
+                )
+                for iseg, seg in enumerate(transcript.segments)
+            ),
+        )
         transcript.split(target_dir)
 
         return
@@ -3,28 +3,201 @@
 Module for organizing SPH/MP3/WAV & STM files from a corpus
 """
 
-import glob
+import hashlib
+import logging
 import os
 import random
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor
-from functools import partial
-
-from tqdm import tqdm
 
 from asrtoolkit.data_structures.audio_file import audio_file
-from asrtoolkit.data_structures.exemplar import exemplar
+from asrtoolkit.data_structures.exemplar import exemplar, transcript_stats
+from asrtoolkit.data_structures.manifest import (
+    append_journal,
+    apply_record,
+    exemplar_record,
+    is_complete,
+    is_fresh,
+    journal_key,
+    read_journal,
+    read_manifest,
+    seed_hashes,
+    seed_journal_sources,
+    write_manifest,
+)
+from asrtoolkit.data_structures.scheduler import scheduler
+from asrtoolkit.data_structures.segment import segment
 from asrtoolkit.data_structures.time_aligned_text import time_aligned_text
+from asrtoolkit.file_utils.common_file_operations import find_duplicates
 from asrtoolkit.file_utils.name_cleaners import basename, strip_extension
 
+LOGGER = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = ["mp3", "wav", "sph"]
+
+
+def scan_dir(data_dir):
+    """
+    Lists a directory once
+    Returns a map of extension to basename to file path, and a list of subdirectories
+    """
+    files, subdirs = {}, []
+    if data_dir and os.path.isdir(data_dir):
+        with os.scandir(data_dir) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    subdirs.append(entry.path)
+                elif "." in entry.name:
+                    stem, extension = entry.name.rsplit(".", 1)
+                    files.setdefault(extension, {})[stem] = entry.path
+    return files, sorted(subdirs)
+
 
 def get_files(data_dir, extension):
     """
     Gets all files in a data directory with given extension
     """
-    files = []
-    if data_dir and os.path.exists(data_dir):
-        files = glob.glob(data_dir + "/*." + extension)
-    return files
+    return sorted(scan_dir(data_dir)[0].get(extension, {}).values())
+
+
+def list_directories(location, recursive=False, jobs=None):
+    """
+    Lists location and its /sph/ and /stm/ subdirectories,
+    or every directory beneath location if 'recursive' is True
+    If 'jobs' is given, directories at each depth are listed by a pool of threads
+    Returns a map of directory to its scan_dir file map
+    """
+    listings = {}
+    executor = ThreadPoolExecutor(max_workers=jobs) if jobs else None
+    level = [location]
+    while level:
+        results = executor.map(scan_dir, level) if executor else map(scan_dir, level)
+        next_level = []
+        for directory, (files, subdirs) in zip(level, results):
+            listings[directory] = files
+            next_level += [
+                _ for _ in subdirs if recursive or basename(_) in ("sph", "stm")
+            ]
+        level = next_level
+    if executor:
+        executor.shutdown()
+    return listings
+
+
+def find_exemplar_files(location, recursive=False, jobs=None):
+    """
+    Returns list of (audio file, transcript file) pairs in a corpus location
+    from either a flat layout or /sph/ and /stm/ subdirectories
+    If 'recursive' is True, also search sharded layouts in all subdirectories
+    """
+    pairs = []
+    if not location:
+        return pairs
+
+    listings = list_directories(location, recursive, jobs)
+    for directory, files in listings.items():
+        transcripts = files.get("stm", {})
+        if basename(directory) == "sph":
+            # pair nested audio with transcripts in the sibling /stm/ directory
+            sibling = os.path.join(os.path.dirname(directory), "stm")
+            transcripts = listings.get(sibling, {}).get("stm", {})
+        pairs += [
+            (files[audio_extension][stem], transcripts[stem])
+            for audio_extension in AUDIO_EXTENSIONS
+            for stem in sorted(files.get(audio_extension, {}))
+            if stem in transcripts
+        ]
+    return pairs
+
+
+def exemplar_from_record(record):
+    """
+    Returns an exemplar for the files and cached stats in a manifest or journal record
+    """
+    return apply_record(
+        exemplar(
+            {
+                "audio_file": audio_file(record["audio_file"]),
+                "transcript_file": time_aligned_text(
+                    record["transcript_file"], deferred=True
+                ),
+            }
+        ),
+        record,
+    )
+
+
+def speaker_groups(exemplars, ignored_speakers=(segment.speaker,)):
+    """
+    Groups exemplar indices so that exemplars sharing any speaker are in the same group
+    Speakers in ignored_speakers (by default, the unknown speaker) do not link exemplars
+    """
+    parent = list(range(len(exemplars)))
+
+    def find(i):
+        " find root of i, halving paths along the way "
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    first_exemplar_for_speaker = {}
+    for i, eg in enumerate(exemplars):
+        for speaker in eg.list_speakers():
+            if speaker in ignored_speakers:
+                continue
+            j = first_exemplar_for_speaker.setdefault(speaker, i)
+            parent[find(i)] = find(j)
+
+    groups = {}
+    for i in range(len(exemplars)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def deduplicate(exemplars):
+    """
+    Returns exemplars without those whose audio duplicates an earlier exemplar's audio
+    Audio is compared by a cheap fingerprint and only fully hashed on collisions
+    """
+    duplicates = find_duplicates([eg.audio_file.location for eg in exemplars])
+    return [eg for i, eg in enumerate(exemplars) if i not in duplicates]
+
+
+def shard_of(eg, num_shards):
+    """
+    Returns the shard of num_shards an exemplar is assigned to
+    by hashing its audio file name without directory or extension,
+    so every node assigns exemplars identically and files prepared
+    under the same output name are prepared by the same shard
+    """
+    name = strip_extension(basename(eg.audio_file.location))
+    return int(hashlib.sha1(name.encode("utf-8")).hexdigest(), 16) % num_shards
+
+
+def histogram(values, bins=10):
+    """
+    Returns counts of values in equal width bins with the bin edges
+
+    >>> histogram([0, 1, 1, 4], bins=2)
+    {'edges': [0.0, 2.0, 4.0], 'counts': [3, 1]}
+    """
+    low, high = (min(values), max(values)) if values else (0, 0)
+    width = (high - low) / bins or 1
+    counts = [0] * bins
+    for value in values:
+        counts[min(int((value - low) / width), bins - 1)] += 1
+    return {
+        "edges": [float(low + width * i) for i in range(bins + 1)],
+        "counts": counts,
+    }
+
+
+EXEMPLAR_WEIGHTS = {
+    "duration": lambda eg: eg.speech_duration(),
+    "words": lambda eg: eg.n_words,
+    "segments": lambda eg: eg.count_segments(),
+}
 
 
 class corpus(object):
@@ -36,6 +209,12 @@ class corpus(object):
     location = None
     exemplars = []
     n_words = 0
+    # if True, store and reuse per-exemplar stats in a manifest at location
+    use_manifest = False
+    # if True, search all subdirectories of location for exemplars
+    recursive = False
+    # number of threads listing directories during discovery
+    discovery_jobs = None
 
     def __init__(self, *args, **kwargs):
         """
@@ -51,62 +230,121 @@ class corpus(object):
             setattr(self, key, kwargs[key])
 
         # only if not defined above should we search for exemplars
-        # based on location
-        if not self.exemplars:
+        # based on location, so an explicitly empty list stays empty
+        if "exemplars" not in vars(self):
             # instantiate exemplars for this object to override
             # static class variable
             self.exemplars = []
 
-            audio_extensions_to_try = ["sph", "wav", "mp3"][::-1]
-            self.exemplars += [
-                exemplar(
+            records = read_manifest(self.location) if self.use_manifest else {}
+            n_stale = 0
+            for audio_file_name, transcript_file_name in find_exemplar_files(
+                self.location, self.recursive, self.discovery_jobs
+            ):
+                eg = exemplar(
                     {
-                        "audio_file": audio_file(fl),
+                        "audio_file": audio_file(audio_file_name),
                         "transcript_file": time_aligned_text(
-                            strip_extension(fl) + ".stm"
+                            transcript_file_name, deferred=True
                         ),
                     }
                 )
-                for audio_extension in audio_extensions_to_try
-                for fl in (
-                    get_files(self.location, audio_extension) if self.location else []
-                )
-                if (os.path.exists(strip_extension(fl) + ".stm"))
-            ]
+                record = records.get(audio_file_name)
+                if self.use_manifest and is_fresh(
+                    record, audio_file_name, transcript_file_name
+                ):
+                    apply_record(eg, record)
+                elif self.use_manifest:
+                    n_stale += 1
+                self.exemplars.append(eg)
+
+            if self.use_manifest and (n_stale or len(records) != len(self.exemplars)):
+                self.update_manifest()
+
+    def update_manifest(self):
+        """
+        Count words, segments, and speech duration of each exemplar
+        and store them with file hashes in the manifest at this corpus location
+        """
+        if not self.location:
+            return
+        self.count_stats()
+        write_manifest(self.location, map(exemplar_record, self.exemplars))
 
-            # gather all exemplars from /stm and /sph subdirectories if present
-            self.exemplars += [
-                exemplar(
-                    {
-                        "audio_file": audio_file(fl),
-                        "transcript_file": time_aligned_text(
-                            self.location
-                            + "/stm/"
-                            + basename(strip_extension(fl))
-                            + ".stm"
-                        ),
-                    }
-                )
-                for audio_extension in audio_extensions_to_try
-                for fl in (
-                    get_files(self.location + "/sph/", audio_extension)
-                    if self.location
-                    else []
-                )
-                if (
-                    os.path.exists(
-                        self.location + "/stm/" + basename(strip_extension(fl)) + ".stm"
-                    )
+    def count_stats(self, **scheduler_options):
+        """
+        Count stats of each exemplar without cached stats, reading each transcript once
+        Transcripts are read in parallel by a process pool
+        scheduler_options (threads, processes, window, timeout, retries) configure the scheduler
+        Returns the number of exemplars counted
+        """
+        pending = [eg for eg in self.exemplars if not eg.has_stats()]
+        if pending:
+            with scheduler(scheduler_options) as schedule:
+                results = schedule.map(
+                    (
+                        [("process", transcript_stats, eg.transcript_file.location)]
+                        for eg in pending
+                    ),
+                    total=len(pending),
                 )
-            ]
+                for position, (stats,) in results:
+                    if stats is not None:
+                        pending[position].apply_stats(stats)
+        return len(pending)
+
+    def stats(self, vocab=None, bins=10, **scheduler_options):
+        """
+        Returns stats of the valid exemplars in this corpus:
+        total words, segments, speech duration, and files, the speakers,
+        the number of distinct words, and histograms over files of their words,
+        segments, and duration, each with the given number of bins.
+        If vocab, an iterable of words, is given, the rate of words and distinct words
+        out of vocabulary is included.
+        Stats of each exemplar are counted in one parallel pass and cached,
+        and stored in the manifest if use_manifest is set, so later calls read no transcripts
+        """
+        if self.count_stats(**scheduler_options) and self.use_manifest:
+            self.update_manifest()
+        # exemplars whose transcripts could not be read are left out
+        valid_exemplars = [
+            eg for eg in self.exemplars if eg.has_stats() and eg.validate()
+        ]
+
+        word_counts = Counter()
+        for eg in valid_exemplars:
+            word_counts.update(eg.word_counts)
+        n_words = sum(eg.n_words for eg in valid_exemplars)
+        stats = {
+            "files": len(valid_exemplars),
+            "words": n_words,
+            "segments": sum(eg.n_segments for eg in valid_exemplars),
+            "duration": sum(eg.duration for eg in valid_exemplars),
+            "speakers": sorted({s for eg in valid_exemplars for s in eg.speakers}),
+            "distinct_words": len(word_counts),
+            "histograms": {
+                name: histogram([weigh(eg) for eg in valid_exemplars], bins)
+                for name, weigh in EXEMPLAR_WEIGHTS.items()
+            },
+        }
+        if vocab is not None:
+            vocab = set(vocab)
+            oov = [word for word in word_counts if word not in vocab]
+            stats["oov_rate"] = (
+                sum(word_counts[word] for word in oov) / n_words if n_words else 0.0
+            )
+            stats["oov_distinct_rate"] = (
+                len(oov) / len(word_counts) if word_counts else 0.0
+            )
+        return stats
 
     def validate(self):
         """
-        Check and validate each example after sorting by audio file hash
+        Check and validate each example after deduplicating by audio file contents
         since stm hash may change
+        Keeps exemplars in their original order so splits are reproducible
         """
-        dict_of_examples = {_.audio_file.hash(): _ for _ in self.exemplars}
-        self.exemplars = [dict_of_examples[_] for _ in set(dict_of_examples)]
+        self.exemplars = deduplicate(self.exemplars)
         return sum(_.validate() for _ in self.exemplars)
 
     def count_exemplar_words(self):
@@ -118,13 +356,17 @@ class corpus(object):
 
         total_words = 0
         for eg in valid_exemplars:
-            eg.n_words = eg.count_words()
+            if eg.n_words is None:
+                eg.n_words = eg.count_words()
             total_words += eg.n_words
         return valid_exemplars, total_words
 
-    def split(self, split_words, min_segments=10):
+    def split(self, split_words, min_segments=10, split_duration=None, seed=None):
         """
         Select exemplars to create data split with specified number of words and minimum number of segments
+        and, if split_duration is given, more than split_duration seconds of speech
+        Exemplars are shuffled once and the split is the shortest prefix meeting every quota
+        Set seed for a reproducible split, otherwise the global random state is used
         Returns the new splits as separate corpora
         """
         valid_exemplars, total_words = self.count_exemplar_words()
@@ -137,19 +379,26 @@ class corpus(object):
                 )
             )
 
-        exemplars_in_split = []
-        word_counter, seg_counter = 0, 0
-        while word_counter <= split_words or seg_counter <= min_segments:
-            exemplars_in_split += [
-                valid_exemplars.pop(random.randrange(len(valid_exemplars)))
-            ]
-            word_counter += exemplars_in_split[-1].n_words
-            seg_counter += len(exemplars_in_split[-1].transcript_file.segments)
+        (random.Random(seed) if seed is not None else random).shuffle(valid_exemplars)
+
+        n_in_split = 0
+        word_counter, seg_counter, duration_counter = 0, 0, 0.0
+        while n_in_split < len(valid_exemplars) and (
+            word_counter <= split_words
+            or seg_counter <= min_segments
+            or (split_duration is not None and duration_counter <= split_duration)
+        ):
+            eg = valid_exemplars[n_in_split]
+            word_counter += eg.n_words
+            seg_counter += eg.count_segments()
+            if split_duration is not None:
+                duration_counter += eg.speech_duration()
+            n_in_split += 1
 
         new_corpus = corpus(
             {
                 "location": self.location,
-                "exemplars": exemplars_in_split,
+                "exemplars": valid_exemplars[:n_in_split],
             }
         )
 
@@ -158,6 +407,69 @@ class corpus(object):
 
         return remaining_corpus, new_corpus
 
+    def stratified_split(self, quotas, weight="duration", seed=None, tag_func=None):
+        """
+        Split valid exemplars into speaker-disjoint corpora
+        quotas maps split names to their fraction of the total weight,
+        where weight is one of "duration", "words", or "segments"
+        Exemplars sharing a speaker are kept together and each group is assigned,
+        largest first, to the split furthest below its quota.
+        If tag_func is given, quotas are met separately for each tag it returns,
+        using the tag of the first exemplar in each speaker group.
+        Set seed for a reproducible split, otherwise the global random state is used
+        Returns dict of split names to corpora
+        """
+        valid_exemplars, _ = self.count_exemplar_words()
+        weigh = EXEMPLAR_WEIGHTS[weight]
+        weights = [weigh(eg) for eg in valid_exemplars]
+
+        groups = speaker_groups(valid_exemplars)
+        (random.Random(seed) if seed is not None else random).shuffle(groups)
+        groups.sort(key=lambda group: -sum(weights[i] for i in group))
+
+        tags = [
+            tag_func(valid_exemplars[group[0]]) if tag_func else None
+            for group in groups
+        ]
+        tag_totals = {}
+        for group, tag in zip(groups, tags):
+            tag_totals[tag] = tag_totals.get(tag, 0) + sum(weights[i] for i in group)
+
+        assigned = {(name, tag): 0 for name in quotas for tag in tag_totals}
+        splits = {name: [] for name in quotas}
+        for group, tag in zip(groups, tags):
+            name = max(
+                quotas,
+                key=lambda name: quotas[name] * tag_totals[tag]
+                - assigned[(name, tag)],
+            )
+            assigned[(name, tag)] += sum(weights[i] for i in group)
+            splits[name] += [valid_exemplars[i] for i in group]
+
+        return {
+            name: corpus({"location": self.location, "exemplars": exemplars})
+            for name, exemplars in splits.items()
+        }
+
+    def shard(self, shard_index, num_shards):
+        """
+        Returns a corpus of the exemplars assigned to shard_index of num_shards shards
+        """
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(
+                "shard index {} is not in range for {} shards".format(
+                    shard_index, num_shards
+                )
+            )
+        return corpus(
+            {
+                "location": self.location,
+                "exemplars": [
+                    eg for eg in self.exemplars if shard_of(eg, num_shards) == shard_index
+                ],
+            }
+        )
+
     def log(self):
         """
         Log what each hashed example contains
@@ -176,33 +488,85 @@ class corpus(object):
         """
         Calculate how many segments are in this corpus
         """
-        return sum(len(eg.transcript_file.segments) for eg in self.exemplars)
-
-    def prepare_for_training(self, target=None, nested=False, sample_rate=16000):
+        return sum(eg.count_segments() for eg in self.exemplars)
+
+    def prepare_for_training(
+        self,
+        target=None,
+        nested=False,
+        sample_rate=16000,
+        resume=False,
+        shard=None,
+        log=None,
+        **scheduler_options,
+    ):
         """
         Run validation and audio file preparation steps
+        If resume is True, exemplars are recorded in a journal in target as they complete
+        and exemplars already prepared with the same contents and parameters are skipped
+        If this corpus is an (index, count) shard, the journal is kept for that shard
+        If log is given, it is called with each prepared exemplar as it completes,
+        such as to stream records to a log_writer, and nothing is returned;
+        otherwise a log of the prepared corpus is returned
+        scheduler_options (threads, processes, window, timeout, retries) configure the scheduler
         """
 
         # write corpus back in place if no target
         target = self.location if target is None else target
 
-        executor = ThreadPoolExecutor()
+        new_exemplars = [None] * len(self.exemplars)
+        keys = [None] * len(self.exemplars)
+        if resume:
+            journal = read_journal(target, shard)
+            seed_journal_sources(journal)
+            for i, eg in enumerate(self.exemplars):
+                keys[i] = journal_key(eg, sample_rate=sample_rate, nested=nested)
+                if is_complete(journal.get(keys[i])):
+                    new_exemplars[i] = exemplar_from_record(journal[keys[i]])
+                    if log:
+                        log(new_exemplars[i])
+            LOGGER.info(
+                "Resuming with %d of %d exemplars already prepared in %s",
+                len(self.exemplars) - new_exemplars.count(None),
+                len(self.exemplars),
+                target,
+            )
 
-        # process audio files concurrently for speed
-        futures = [
-            executor.submit(
-                partial(
-                    _.prepare_for_training,
-                    target=target,
-                    sample_rate=sample_rate,
-                    nested=nested,
-                )
+        # resample audio with sox in threads and rewrite transcripts in processes
+        pending = [i for i, eg in enumerate(self.exemplars) if new_exemplars[i] is None]
+        with scheduler(scheduler_options) as schedule:
+            results = schedule.map(
+                (
+                    self.exemplars[i].preparation_tasks(
+                        target, sample_rate, nested, schedule.timeout
+                    )
+                    for i in pending
+                ),
+                total=len(pending),
             )
-            for _ in self.exemplars
-        ]
+            # gather results, journaling and logging each as it completes
+            for position, (af, tf_result) in results:
+                i = pending[position]
+                tf = None
+                if tf_result:
+                    # reuse the hash computed as the transcript was written
+                    tf_location, tf_hash = tf_result
+                    seed_hashes(
+                        {"transcript_file": tf_location, "transcript_file_hash": tf_hash}
+                    )
+                    tf = time_aligned_text(tf_location, deferred=True)
+                new_exemplars[i] = self.exemplars[i].prepared(af, tf)
+                if new_exemplars[i] is None:
+                    continue
+                if resume:
+                    append_journal(
+                        target, keys[i], new_exemplars[i], self.exemplars[i], shard
+                    )
+                if log:
+                    log(new_exemplars[i])
 
-        # trigger conversion and gather results
-        new_exemplars = [future.result() for future in tqdm(futures)]
+        if log:
+            return None
 
         new_corpus = corpus(
             {
@@ -223,17 +587,19 @@ class corpus(object):
         return self
 
     def __sub__(self, other):
-        """ Allow addition of corpora via - operator """
+        """ Allow subtraction of corpora via - operator """
+        other_exemplars = set(other.exemplars)
         return corpus(
             {
                 "location": None,
-                "exemplars": [_ for _ in self.exemplars if _ not in other.exemplars],
+                "exemplars": [_ for _ in self.exemplars if _ not in other_exemplars],
             }
         )
 
     def __isub__(self, other):
         """ Allow subtraction of corpora via -= operator """
-        self.exemplars = [_ for _ in self.exemplars if _ not in other.exemplars]
+        other_exemplars = set(other.exemplars)
+        self.exemplars = [_ for _ in self.exemplars if _ not in other_exemplars]
         return self
 
     def __getitem__(self, given):
@@ -3,12 +3,51 @@
 """
 Stores exemplar class for corpus management
 """
+
 import os
+from collections import Counter
 
 from asrtoolkit.clean_formatting import clean_up
+from asrtoolkit.data_structures.time_aligned_text import time_aligned_text
 from asrtoolkit.file_utils.name_cleaners import basename, strip_extension
 
 
+def transcript_stats(transcript_file_name, clean_func=clean_up):
+    """
+    Reads a transcript once and returns its counted words, segments, speech duration,
+    and speakers, with the number of times each cleaned word occurs
+    """
+    tf = time_aligned_text(transcript_file_name)
+    words = clean_func(tf.text()).split()
+    return {
+        "n_words": len(words),
+        "n_segments": len(tf.segments),
+        "duration": sum(float(seg.stop) - float(seg.start) for seg in tf.segments),
+        "speakers": sorted({seg.speaker for seg in tf.segments}),
+        "word_counts": dict(Counter(words)),
+    }
+
+
+def prepare_audio(source, target, sample_rate=16000, timeout=None):
+    """
+    Convert an audio file for training and hash the result while it is cached
+    Returns the target audio_file, or None on failure
+    """
+    af = source.prepare_for_training(target, sample_rate, timeout)
+    if af:
+        af.hash()
+    return af
+
+
+def prepare_transcript(source, target):
+    """
+    Read a transcript file and write it to target for training
+    Returns the target location and hash, so the hash need not be computed again
+    """
+    tf = time_aligned_text(source).write(target, reread=False)
+    return tf.location, tf.hash()
+
+
 class exemplar(object):
     """
     Create an exemplar class to pair one audio file with one transcript file
@@ -16,6 +55,12 @@ class exemplar(object):
 
     audio_file = None
     transcript_file = None
+    # cached counts, populated on first use or from a corpus manifest
+    n_words = None
+    n_segments = None
+    duration = None
+    speakers = None
+    word_counts = None
 
     def __init__(self, *args, **kwargs):
         " Instantiate using input args and kwargs "
@@ -26,6 +71,20 @@ class exemplar(object):
         for key in kwargs:
             setattr(self, key, kwargs[key])
 
+    def identity(self):
+        """
+        Returns a stable key identifying this exemplar by its audio file path
+        """
+        return os.path.abspath(self.audio_file.location) if self.audio_file else None
+
+    def __eq__(self, other):
+        """ Exemplars are equal if they share an audio file """
+        return isinstance(other, exemplar) and self.identity() == other.identity()
+
+    def __hash__(self):
+        """ Hash exemplars by identity so they can be used in sets and dicts """
+        return hash(self.identity())
+
     def validate(self):
         """
         Validates exemplar object by constraining that the filenames before the
@@ -56,11 +115,53 @@ class exemplar(object):
             else 0
         )
 
-    def prepare_for_training(self, target, sample_rate=16000, nested=False):
+    def count_segments(self):
+        """ Count segments in an exemplar, caching the result """
+        if self.n_segments is None:
+            self.n_segments = len(self.transcript_file.segments)
+        return self.n_segments
+
+    def speech_duration(self):
+        """ Total duration in seconds of segments in an exemplar, caching the result """
+        if self.duration is None:
+            self.duration = sum(
+                float(seg.stop) - float(seg.start)
+                for seg in self.transcript_file.segments
+            )
+        return self.duration
+
+    def list_speakers(self):
+        """ List speakers in an exemplar's segments, caching the result """
+        if self.speakers is None:
+            self.speakers = sorted(
+                {seg.speaker for seg in self.transcript_file.segments}
+            )
+        return self.speakers
+
+    def has_stats(self):
+        " Returns True if every stat counted by transcript_stats is cached "
+        return None not in (
+            self.n_words,
+            self.n_segments,
+            self.duration,
+            self.speakers,
+            self.word_counts,
+        )
+
+    def apply_stats(self, stats):
         """
-        Prepare one exemplar for training
-        Returning a new exemplar object with updated file locations
-        and a resampled audio_file
+        Caches stats returned by transcript_stats
+        Invalid exemplars count no words, as in count_words
+        """
+        for key, value in stats.items():
+            setattr(self, key, value)
+        if not self.validate():
+            self.n_words = 0
+        return self
+
+    def target_locations(self, target, nested=False):
+        """
+        Returns locations of the audio and transcript files once prepared in target
         """
         if nested:
             af_target_file = os.path.join(
@@ -74,19 +175,70 @@ class exemplar(object):
             tf_target_file = os.path.join(
                 target, basename(self.transcript_file.location)
             )
+        return af_target_file, tf_target_file
+
+    def preparation_tasks(self, target, sample_rate=16000, nested=False, timeout=None):
+        """
+        Returns scheduler tasks which prepare this exemplar's files in target
+        Audio is resampled by sox from a thread, killing sox after timeout seconds,
+        and the transcript is re-read from its file and rewritten in a separate process
+        Both outputs are hashed as they are written
+        """
+        af_target_file, tf_target_file = self.target_locations(target, nested)
+        return [
+            (
+                "thread",
+                prepare_audio,
+                self.audio_file,
+                af_target_file,
+                sample_rate,
+                timeout,
+            ),
+            (
+                "process",
+                prepare_transcript,
+                self.transcript_file.location,
+                tf_target_file,
+            ),
+        ]
+
+    def prepared(self, af, tf):
+        """
+        Returns a new exemplar for prepared audio and transcript files
+        carrying over cached counts, or None if either failed
+        """
+        return (
+            exemplar(
+                {
+                    "audio_file": af,
+                    "transcript_file": tf,
+                    "n_words": self.n_words,
+                    "n_segments": self.n_segments,
+                    "duration": self.duration,
+                    "speakers": self.speakers,
+                    "word_counts": self.word_counts,
+                }
+            )
+            if all([af, tf])
+            else None
+        )
+
+    def prepare_for_training(self, target, sample_rate=16000, nested=False):
+        """
+        Prepare one exemplar for training
+        Returning a new exemplar object with updated file locations
+        and a resampled audio_file
+        """
+        af_target_file, tf_target_file = self.target_locations(target, nested)
 
         af = self.audio_file.prepare_for_training(
             af_target_file,
             sample_rate=sample_rate,
         )
 
-        tf = self.transcript_file.write(tf_target_file)
+        tf = self.transcript_file.write(tf_target_file, reread=False)
 
-        return (
-            exemplar({"audio_file": af, "transcript_file": tf})
-            if all([af, tf])
-            else None
-        )
+        return self.prepared(af, tf)
 
     def hash(self):
         """
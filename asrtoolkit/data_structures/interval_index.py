@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Class for answering time-range queries over segments
+
+"""
+from bisect import bisect_left, bisect_right
+
+
+def build_tree(indices, starts, stops):
+    """
+    Build a centered interval tree over intervals given by indices sorted by start
+    Each node is (center, intervals containing center sorted by start,
+    the same intervals sorted by descending stop, left subtree, right subtree)
+    """
+    if not indices:
+        return None
+    center = starts[indices[len(indices) // 2]]
+    at_center = [i for i in indices if starts[i] <= center < stops[i]]
+    return (
+        center,
+        at_center,
+        sorted(at_center, key=lambda i: -stops[i]),
+        build_tree([i for i in indices if stops[i] <= center], starts, stops),
+        build_tree([i for i in indices if starts[i] > center], starts, stops),
+    )
+
+
+class interval_index(object):
+    """
+    Sorted-array and interval-tree index over segment start and stop times
+
+    Segments are sorted by start time. A centered interval tree finds the
+    segments containing a time, and a binary search over start times finds
+    those starting inside a range, so queries cost O(log n + k) for k matches
+    however long the segments are.
+    """
+
+    def __init__(self, segments):
+        """
+        Build index from an iterable of segments with start and stop times
+        >>> from asrtoolkit.data_structures.segment import segment
+        >>> index = interval_index(
+        ...     [segment(start=s, stop=s + 1, text=str(s)) for s in (2, 0, 1)]
+        ... )
+        >>> [_.text for _ in index.segments]
+        ['0', '1', '2']
+        """
+        keyed = sorted(
+            ((float(seg.start), float(seg.stop), i), seg)
+            for i, seg in enumerate(segments)
+        )
+        self.segments = [seg for _, seg in keyed]
+        self.starts = [key[0] for key, _ in keyed]
+        self.stops = [key[1] for key, _ in keyed]
+        # zero-length segments contain no time, so only appear in range queries
+        self.tree = build_tree(
+            [i for i in range(len(keyed)) if self.stops[i] > self.starts[i]],
+            self.starts,
+            self.stops,
+        )
+
+    def __len__(self):
+        return len(self.segments)
+
+    def containing(self, t):
+        """
+        Returns sorted positions of segments with start <= t < stop
+        """
+        found = []
+        node = self.tree
+        while node is not None:
+            center, by_start, by_stop, left, right = node
+            if t < center:
+                for i in by_start:
+                    if self.starts[i] > t:
+                        break
+                    found.append(i)
+                node = left
+            else:
+                for i in by_stop:
+                    if self.stops[i] <= t:
+                        break
+                    found.append(i)
+                node = right
+        return sorted(found)
+
+    def between(self, t0, t1):
+        """
+        Returns segments overlapping the time range t0 to t1, sorted by start
+        >>> from asrtoolkit.data_structures.segment import segment
+        >>> index = interval_index(
+        ...     [segment(start=s, stop=s + 1, text=str(s)) for s in range(5)]
+        ...     + [segment(start=0, stop=10, text="long")]
+        ... )
+        >>> [_.text for _ in index.between(1.5, 3.0)]
+        ['long', '1', '2']
+        """
+        t0, t1 = float(t0), float(t1)
+        # segments already running at t0, then segments starting within the range
+        return [
+            self.segments[i] for i in self.containing(t0) if self.starts[i] < t1
+        ] + [
+            self.segments[i]
+            for i in range(bisect_right(self.starts, t0), bisect_left(self.starts, t1))
+        ]
+
+    def at(self, t):
+        """
+        Returns the latest-starting segment containing time t, else None
+        >>> from asrtoolkit.data_structures.segment import segment
+        >>> index = interval_index(
+        ...     [segment(start=s, stop=s + 1, text=str(s)) for s in range(5)]
+        ... )
+        >>> index.at(2.0).text
+        '2'
+        >>> index.at(7.0) is None
+        True
+        """
+        found = self.containing(float(t))
+        return self.segments[found[-1]] if found else None
+
+    def overlaps(self, other):
+        """
+        Yields pairs of overlapping segments from this index and another
+        """
+        for seg in self.segments:
+            for other_seg in other.between(seg.start, seg.stop):
+                yield seg, other_seg
+
+    def self_overlaps(self):
+        """
+        Yields each pair of overlapping segments within this index once
+        >>> from asrtoolkit.data_structures.segment import segment
+        >>> index = interval_index(
+        ...     [segment(start=s, stop=s + 1.5, text=str(s)) for s in range(3)]
+        ... )
+        >>> [(a.text, b.text) for a, b in index.self_overlaps()]
+        [('0', '1'), ('1', '2')]
+        """
+        for i, stop in enumerate(self.stops):
+            for j in range(i + 1, bisect_left(self.starts, stop)):
+                if self.stops[j] > self.starts[i]:
+                    yield self.segments[i], self.segments[j]
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Class for holding segments of a memory-mapped, line-based transcript
+
+"""
+import mmap
+import os
+from array import array
+
+
+def index_lines(data):
+    """
+    Returns arrays of start and end offsets of non-empty lines in data
+    >>> starts, ends = index_lines(b"a b\\n\\nc d")
+    >>> list(starts), list(ends)
+    ([0, 5], [3, 8])
+    """
+    starts, ends = array("Q"), array("Q")
+    position, size = 0, len(data)
+    while position < size:
+        end = data.find(b"\n", position)
+        end = size if end < 0 else end
+        if end > position:
+            starts.append(position)
+            ends.append(end)
+        position = end + 1
+    return starts, ends
+
+
+class lazy_segments(object):
+    """
+    Sequence of segments backed by a memory-mapped file
+    Only a line-offset index is built up front.
+    Lines are parsed in order as segments are accessed and then cached.
+    Lines which fail to parse are skipped, so indices and length match an eager read.
+    Taking the length or a negative index parses every line.
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile("w", suffix=".txt") as f:
+    ...     _ = f.write("1\\nskip\\n2\\n3\\n")
+    ...     f.flush()
+    ...     segments = lazy_segments(f.name, lambda x: int(x) if x.isdigit() else None)
+    ...     segments[1], segments[-1], len(segments), segments[1:], list(segments)
+    (2, 3, 3, [2, 3], [1, 2, 3])
+    """
+
+    def __init__(self, file_name, parse_line):
+        """
+        Memory-map file_name and index its lines
+        parse_line converts one line of text into a segment or None
+        """
+        self.parse_line = parse_line
+        self.data = b""
+        if os.path.getsize(file_name):
+            with open(file_name, "rb") as f:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.starts, self.ends = index_lines(self.data)
+        # line numbers of valid segments found so far, and number of lines parsed
+        self.valid = array("Q")
+        self.scanned = 0
+        self.cache = {}
+
+    def materialize(self, line_number):
+        " parse a single line into a segment, caching the result "
+        if line_number not in self.cache:
+            line = self.data[self.starts[line_number] : self.ends[line_number]]
+            self.cache[line_number] = self.parse_line(line.decode("utf-8"))
+        return self.cache[line_number]
+
+    def resolve(self, count=None):
+        """
+        Parse lines until count valid segments are found, or all lines if count is None
+        Returns True if at least count valid segments exist
+        """
+        while (count is None or len(self.valid) < count) and self.scanned < len(
+            self.starts
+        ):
+            if self.materialize(self.scanned) is not None:
+                self.valid.append(self.scanned)
+            self.scanned += 1
+        return count is None or len(self.valid) >= count
+
+    def __len__(self):
+        " number of valid segments "
+        self.resolve()
+        return len(self.valid)
+
+    def __getitem__(self, given):
+        """
+        Returns a segment for an index or a list of segments for a slice
+        """
+        if isinstance(given, slice):
+            if (
+                given.stop is not None
+                and given.stop >= 0
+                and (given.start or 0) >= 0
+                and (given.step or 1) > 0
+            ):
+                self.resolve(given.stop)
+            else:
+                self.resolve()
+            return [self.cache[_] for _ in self.valid[given]]
+        if given < 0:
+            self.resolve()
+        elif not self.resolve(given + 1):
+            raise IndexError("segment index out of range")
+        return self.cache[self.valid[given]]
+
+    def __iter__(self):
+        " iterate over valid segments "
+        i = 0
+        while self.resolve(i + 1):
+            yield self.cache[self.valid[i]]
+            i += 1
+
+    def __add__(self, other):
+        " concatenate as a list of segments "
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        " concatenate as a list of segments "
+        return list(other) + list(self)
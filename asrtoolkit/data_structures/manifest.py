@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+"""
+Module for reading and writing corpus manifests
+
+A manifest is a JSONL file stored with a corpus, with one record per exemplar.
+Records hold file stats, hashes, and counts so that unchanged exemplars
+do not need to be re-read or re-hashed when the corpus is loaded again.
+
+A journal is a JSONL file stored in a target directory while preparing a corpus,
+with one manifest record per prepared exemplar, keyed by the source file hashes
+and preparation parameters, so that interrupted or repeated runs can resume.
+Each shard of a sharded preparation keeps its own journal.
+Records also hold the source files' stats and hashes, so unchanged sources
+are not hashed again when resuming.
+
+A corpora log is a JSONL file stored in a target directory after preparing corpora,
+with one record per prepared exemplar, written as each exemplar completes.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+from asrtoolkit.file_utils.common_file_operations import FILE_HASHES, file_stat_key
+
+MANIFEST_NAME = "corpus_manifest.jsonl"
+JOURNAL_NAME = "prepare_journal.jsonl"
+SHARD_JOURNAL_NAME = "prepare_journal.shard-{}-of-{}.jsonl"
+
+
+def manifest_location(location):
+    " Returns path of the manifest for a corpus location "
+    return os.path.join(location, MANIFEST_NAME)
+
+
+def read_manifest(location):
+    """
+    Returns dict of manifest records keyed by audio file path
+    or an empty dict if there is no manifest
+    """
+    records = {}
+    if location and os.path.exists(manifest_location(location)):
+        with open(manifest_location(location), encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    records[record["audio_file"]] = record
+    return records
+
+
+def write_manifest(location, records):
+    """
+    Atomically writes manifest records for a corpus location
+    """
+    file_name = manifest_location(location)
+    # a unique temporary file, since nodes preparing shards may share a corpus
+    fd, tmp_name = tempfile.mkstemp(suffix=".tmp", dir=location)
+    with open(fd, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    os.replace(tmp_name, file_name)
+
+
+def file_stats(file_name):
+    " Returns [size, mtime_ns, inode] for a file "
+    return list(file_stat_key(file_name)[1:])
+
+
+def is_fresh(record, audio_file_name, transcript_file_name):
+    """
+    Returns True if a record describes the current versions of both files
+    """
+    return (
+        record is not None
+        and record["transcript_file"] == transcript_file_name
+        and record["audio_stats"] == file_stats(audio_file_name)
+        and record["transcript_stats"] == file_stats(transcript_file_name)
+    )
+
+
+def seed_hashes(record):
+    """
+    Adds hashes from a fresh record to the in-memory hash cache
+    """
+    for file_key in ("audio_file", "transcript_file"):
+        if record.get(file_key + "_hash"):
+            # transcripts other than binary tat files are hashed as text
+            text = file_key == "transcript_file" and not record[file_key].endswith(
+                ".tat"
+            )
+            key = file_stat_key(record[file_key]) + (text,)
+            FILE_HASHES[key] = record[file_key + "_hash"]
+
+
+def apply_record(eg, record):
+    """
+    Restores cached hashes and counts from a fresh record onto an exemplar
+    """
+    seed_hashes(record)
+    eg.n_words = record["n_words"]
+    eg.n_segments = record["n_segments"]
+    eg.duration = record["duration"]
+    eg.speakers = record.get("speakers")
+    eg.word_counts = record.get("word_counts")
+    return eg
+
+
+def exemplar_record(eg):
+    """
+    Returns manifest record for an exemplar with its file hashes
+    and counted words and segments
+    Hashes are computed if they are not already known
+    """
+    audio_file_name = eg.audio_file.location
+    transcript_file_name = eg.transcript_file.location
+    return {
+        "audio_file": audio_file_name,
+        "audio_stats": file_stats(audio_file_name),
+        "audio_file_hash": eg.audio_file.hash(),
+        "transcript_file": transcript_file_name,
+        "transcript_stats": file_stats(transcript_file_name),
+        "transcript_file_hash": eg.transcript_file.hash(),
+        "n_words": eg.n_words,
+        "n_segments": eg.n_segments,
+        "duration": eg.duration,
+        "speakers": eg.speakers,
+        "word_counts": eg.word_counts,
+    }
+
+
+def journal_location(target, shard=None):
+    """
+    Returns path of the preparation journal for a target directory
+    and, if given, an (index, count) shard
+    """
+    if shard is None:
+        return os.path.join(target, JOURNAL_NAME)
+    return os.path.join(target, SHARD_JOURNAL_NAME.format(*shard))
+
+
+def journal_key(eg, **params):
+    """
+    Returns a key identifying an exemplar's source contents and preparation parameters
+    """
+    return hashlib.sha1(
+        json.dumps(
+            [eg.audio_file.hash(), eg.transcript_file.hash(), sorted(params.items())]
+        ).encode()
+    ).hexdigest()
+
+
+def read_journal(target, shard=None):
+    """
+    Returns dict of journal records keyed by journal key
+    Later records win, and a line truncated by an interrupted run is ignored
+    """
+    records = {}
+    if os.path.exists(journal_location(target, shard)):
+        with open(journal_location(target, shard), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                records[record["key"]] = record
+    return records
+
+
+def seed_journal_sources(records):
+    """
+    Adds hashes of unchanged source files recorded in a journal to the in-memory hash cache
+    so that journal keys are computed from file stats without reading the sources again
+    """
+    for record in records.values():
+        source = record.get("source")
+        if (
+            source
+            and os.path.exists(source["audio_file"])
+            and os.path.exists(source["transcript_file"])
+            and is_fresh(source, source["audio_file"], source["transcript_file"])
+        ):
+            seed_hashes(source)
+
+
+def append_journal(target, key, eg, source, shard=None):
+    """
+    Appends a record of an exemplar prepared from source to the journal of a target directory
+    The record holds hashes of both, so they need not be computed again
+    """
+    with open(journal_location(target, shard), "a", encoding="utf-8") as f:
+        record = dict(exemplar_record(eg), key=key, source=exemplar_record(source))
+        f.write(json.dumps(record) + "\n")
+
+
+def is_complete(record):
+    """
+    Returns True if the outputs described by a journal record exist unchanged
+    """
+    return (
+        record is not None
+        and os.path.exists(record["audio_file"])
+        and os.path.exists(record["transcript_file"])
+        and is_fresh(record, record["audio_file"], record["transcript_file"])
+    )
+
+
+def log_record(eg, **fields):
+    """
+    Returns corpora log record of a prepared exemplar's files and hashes
+    with any extra fields, such as the exemplar's split
+    """
+    return dict(
+        fields,
+        key=eg.hash(),
+        audio_file=eg.audio_file.location,
+        audio_file_hash=eg.audio_file.hash(),
+        transcript_file=eg.transcript_file.location,
+        transcript_file_hash=eg.transcript_file.hash(),
+    )
+
+
+class log_writer(object):
+    """
+    Streams corpora log records to a JSONL file as exemplars are prepared
+    Each record is flushed as it is written, so a partial log survives a crash
+    Exemplars whose audio was already logged are skipped, as corpus.validate() does
+    """
+
+    def __init__(self, file_name):
+        " Open file_name for writing "
+        self.file = open(file_name, "w", encoding="utf-8")
+        self.audio_hashes = set()
+
+    def write(self, eg, **fields):
+        """
+        Writes a record for an exemplar with any extra fields
+        Returns True unless the exemplar's audio was already logged
+        """
+        record = log_record(eg, **fields)
+        if record["audio_file_hash"] in self.audio_hashes:
+            return False
+        self.audio_hashes.add(record["audio_file_hash"])
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        return True
+
+    def close(self):
+        " Close the log file "
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
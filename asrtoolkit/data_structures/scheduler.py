@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Class for running corpus preparation work with bounded concurrency
+
+"""
+
+import logging
+import multiprocessing
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    TimeoutError,
+    wait,
+)
+
+from tqdm import tqdm
+
+LOGGER = logging.getLogger(__name__)
+
+# forking while sox threads hold locks (such as the logging lock) can deadlock workers
+START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else None
+)
+
+
+class scheduler(object):
+    """
+    Runs jobs, each a list of tasks, on two pools
+    - a thread pool for tasks which wait on subprocesses such as sox
+    - a process pool for GIL-bound Python tasks such as transcript cleaning
+
+    A task is a tuple of (pool, function, *args) where pool is "thread" or "process".
+    Functions run on the process pool must be importable module-level functions.
+    At most `window` jobs are in flight at once so memory stays flat for large corpora.
+    A task fails if it raises or returns None, and is retried up to `retries` times.
+    A task still running after `timeout` seconds is abandoned without a retry;
+    tasks should enforce their own timeouts, as sox tasks do, to be retried safely.
+
+    Jobs are yielded as they finish, so results are paired with their job's position.
+
+    >>> with scheduler(processes=0) as schedule:
+    ...     list(schedule.map([[("thread", abs, -1), ("process", len, "ab")]]))
+    [(0, [1, 2])]
+    """
+
+    # workers in each pool, defaulting to the executor defaults
+    # set processes to 0 to run Python tasks on the thread pool instead
+    threads = None
+    processes = None
+    # maximum number of jobs submitted but not yet returned
+    window = 64
+    # seconds to wait for each task result, or None to wait forever
+    timeout = None
+    # number of times a failed task is resubmitted
+    retries = 0
+
+    def __init__(self, *args, **kwargs):
+        " Instantiate using input args and kwargs "
+        for dictionary in args:
+            if isinstance(dictionary, dict):
+                for key in dictionary:
+                    setattr(self, key, dictionary[key])
+        for key in kwargs:
+            setattr(self, key, kwargs[key])
+        self.pools = {}
+        self.abandoned = []
+
+    def __enter__(self):
+        " start worker pools "
+        self.pools["thread"] = ThreadPoolExecutor(self.threads)
+        self.pools["process"] = (
+            ProcessPoolExecutor(
+                self.processes, mp_context=multiprocessing.get_context(START_METHOD)
+            )
+            if self.processes != 0
+            else self.pools["thread"]
+        )
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        shut down worker pools, waiting for running tasks
+        unless exiting on an error or tasks were abandoned after timing out
+        """
+        wait = exc_type is None and not self.abandoned
+        for pool in set(self.pools.values()):
+            pool.shutdown(wait=wait, cancel_futures=not wait)
+        self.pools = {}
+
+    def submit(self, task):
+        " submit a single task to its pool "
+        pool, func, args = task[0], task[1], task[2:]
+        return self.pools[pool].submit(func, *args)
+
+    def result(self, task, future):
+        """
+        Wait for a task's result, retrying failures
+        A task which times out while still running cannot be stopped, so it is
+        abandoned rather than retried, to avoid two attempts writing the same files
+        Returns None if every attempt fails
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                if attempt:
+                    future = self.submit(task)
+                result = future.result(timeout=self.timeout)
+            except TimeoutError:
+                if not future.cancel():
+                    LOGGER.warning(
+                        "Task %s%s timed out after %s seconds and was abandoned",
+                        task[1].__name__,
+                        task[2:],
+                        self.timeout,
+                    )
+                    self.abandoned.append(future)
+                    return None
+                continue
+            except Exception as exc:
+                LOGGER.warning("Task %s%s failed: %s", task[1].__name__, task[2:], exc)
+                continue
+            if result is not None:
+                return result
+        return None
+
+    def map(self, jobs, total=None):
+        """
+        Yields (position, results) for each job as it finishes,
+        where position is the job's index in jobs and results lists its task results
+        jobs may be a generator, and is only consumed as the window allows
+        Progress is reported with tqdm, out of total jobs if known
+        """
+        in_flight = {}
+        progress = tqdm(total=total)
+        try:
+            for position, job in enumerate(jobs):
+                in_flight[position] = (job, [self.submit(task) for task in job])
+                while len(in_flight) >= self.window:
+                    yield from self.finish(in_flight, progress)
+            while in_flight:
+                yield from self.finish(in_flight, progress)
+        finally:
+            for _, futures in in_flight.values():
+                for future in futures:
+                    future.cancel()
+            progress.close()
+
+    def finish(self, in_flight, progress):
+        """
+        Wait for in-flight jobs and yield (position, results) for each finished job
+        If none finish within the timeout, the oldest job is gathered,
+        which retries or abandons its tasks
+        """
+        wait(
+            [
+                future
+                for _, futures in in_flight.values()
+                for future in futures
+                if not future.done()
+            ],
+            timeout=self.timeout,
+            return_when=FIRST_COMPLETED,
+        )
+        finished = [
+            position
+            for position, (_, futures) in in_flight.items()
+            if all(future.done() for future in futures)
+        ]
+        for position in finished or [min(in_flight)]:
+            job, futures = in_flight.pop(position)
+            yield position, self.gather(job, futures)
+            progress.update()
+
+    def gather(self, job, futures):
+        " Returns the results of each task in a job "
+        return [self.result(task, future) for task, future in zip(job, futures)]
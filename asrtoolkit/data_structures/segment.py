@@ -42,6 +42,8 @@ class segment(object):
     formatted_text = ""
     # confidence in accuracy of text
     confidence = 1.0
+    # copy of text known to be unchanged by clean_up, if any
+    normalized_text = None
 
     def __init__(self, *args, **kwargs):
         """
@@ -74,6 +76,20 @@ class segment(object):
 
         return ret_str
 
+    @property
+    def normalized(self):
+        """
+        True if text is known to be unchanged by clean_up
+        Modifying text after it was marked normalized makes this False
+        >>> seg = segment({"text": "this is a test", "normalized_text": "this is a test"})
+        >>> seg.normalized
+        True
+        >>> seg.text = "This is test 2"
+        >>> seg.normalized
+        False
+        """
+        return self.normalized_text is not None and self.normalized_text == self.text
+
     def validate(self):
         """
         Checks for common failure cases for if a line is valid or not
@@ -4,14 +4,65 @@ Class for holding time_aligned text
 """
 
 import hashlib
+import heapq
 import importlib
+import io
+import json
+import logging
 import os
+import tarfile
+import time
+import uuid
+from itertools import islice
 
+from asrtoolkit.data_structures.interval_index import interval_index
+from asrtoolkit.file_utils.common_file_operations import hash_file
 from asrtoolkit.file_utils.name_cleaners import (
+    basename,
     generate_segmented_file_name,
     sanitize_hyphens,
+    strip_extension,
 )
 
+LOGGER = logging.getLogger(__name__)
+
+# bytes buffered before flushing written transcripts to disk
+WRITE_BUFFER_SIZE = 1 << 20
+# segments formatted at a time while writing transcripts
+WRITE_CHUNK_SIZE = 4096
+
+
+def keyed_segments(transcript):
+    """
+    Returns list of ((start, stop), segment) pairs sorted by start then stop time
+    Only sorts if the transcript segments are out of order
+    """
+    keyed = [((float(seg.start), float(seg.stop)), seg) for seg in transcript.segments]
+    if any(a[0] > b[0] for a, b in zip(keyed, islice(keyed, 1, None))):
+        keyed.sort(key=lambda _: _[0])
+    return keyed
+
+
+def formatted_chunks(data_handler, segments, chunk_size=WRITE_CHUNK_SIZE):
+    """
+    Yields formatted text for segments in chunks, including separators,
+    so that large transcripts never need to be formatted into one string
+    """
+    segments = iter(segments)
+    chunk = list(islice(segments, chunk_size))
+    first = True
+    while chunk:
+        if not first:
+            yield data_handler.separator
+        if hasattr(data_handler, "format_segments"):
+            yield data_handler.format_segments(chunk)
+        else:
+            yield data_handler.separator.join(
+                seg.__str__(data_handler) for seg in chunk
+            )
+        first = False
+        chunk = list(islice(segments, chunk_size))
+
 
 class time_aligned_text(object):
     """
@@ -19,13 +70,20 @@ class time_aligned_text(object):
     """
 
     location = ""
-    segments = []
+    stored_segments = []
     file_extension = None
+    cached_index = None
+    # set when reading the file at location is deferred until segments are used
+    deferred = False
+    read_lazily = False
 
-    def __init__(self, input_data=None):
+    def __init__(self, input_data=None, lazy=False, deferred=False):
         """
         Instantiates a time_aligned text object
         If 'input_data' is a string, it tries to find the appropriate file.
+        If 'lazy' is True and the file format supports it, segments are only
+        parsed when accessed.
+        If 'deferred' is True, the file is not read until segments are first used.
 
         >>> transcript = time_aligned_text()
         """
@@ -33,8 +91,18 @@ class time_aligned_text(object):
             input_data is not None
             and isinstance(input_data, str)
             and os.path.exists(input_data)
+            and deferred
+        ):
+            self.file_extension = input_data.split(".")[-1]
+            self.location = input_data
+            self.deferred = True
+            self.read_lazily = lazy
+        elif (
+            input_data is not None
+            and isinstance(input_data, str)
+            and os.path.exists(input_data)
         ):
-            self.read(input_data)
+            self.read(input_data, lazy=lazy)
         elif input_data is not None and type(input_data) in [str, dict]:
             self.file_extension = "txt" if isinstance(input_data, str) else "json"
             data_handler = importlib.import_module(
@@ -42,13 +110,26 @@ class time_aligned_text(object):
             )
             self.segments = data_handler.read_in_memory(input_data)
 
+    @property
+    def segments(self):
+        """
+        List of segments, read from location on first use if reading was deferred
+        """
+        if self.deferred:
+            self.read(self.location, lazy=self.read_lazily)
+        return self.stored_segments
+
+    @segments.setter
+    def segments(self, segments):
+        self.deferred = False
+        self.stored_segments = segments
+
     def hash(self):
         """
         Returns a sha1 hash of the file
         """
         if self.location:
-            with open(self.location) as f:
-                return hashlib.sha1(f.read().encode()).hexdigest()
+            return hash_file(self.location, text=self.file_extension != "tat")
         else:
             return hashlib.sha1("".encode()).hexdigest()
 
@@ -72,16 +153,84 @@ class time_aligned_text(object):
         Add two transcripts
         Set the location after adding if you want to save this!
         """
-        new_segments = self.segments + other.segments
+        return time_aligned_text.merge(self, other)
 
-        # Sort the segments by their start time then stop time
-        new_segments.sort(key=lambda s: (float(s.start), float(s.stop)))
+    @staticmethod
+    def merge(*transcripts):
+        """
+        Merge many transcripts, sorting segments by their start time then stop time
+        Takes linear time for transcripts whose segments are already sorted
+        Logs a warning if segments from the merged transcripts overlap
+        Set the location after merging if you want to save this!
+        """
+        new_segments = []
+        n_overlaps, last_stop = 0, float("-inf")
+        for (start, stop), seg in heapq.merge(
+            *map(keyed_segments, transcripts), key=lambda _: _[0]
+        ):
+            n_overlaps += start < last_stop
+            last_stop = max(last_stop, stop)
+            new_segments.append(seg)
+
+        if n_overlaps:
+            LOGGER.warning(
+                "%d segments overlap with earlier segments after merging", n_overlaps
+            )
 
         out_transcript = time_aligned_text()
-        out_transcript.file_extension = self.file_extension
+        out_transcript.file_extension = (
+            transcripts[0].file_extension if transcripts else None
+        )
         out_transcript.segments = new_segments
         return out_transcript
 
+    def index(self):
+        """
+        Returns an interval_index over segments, built on first use
+        and rebuilt if the segments have been replaced or resized
+        """
+        if (
+            self.cached_index is None
+            or self.cached_index[0] is not self.segments
+            or self.cached_index[1] != len(self.segments)
+        ):
+            self.cached_index = (
+                self.segments,
+                len(self.segments),
+                interval_index(self.segments),
+            )
+        return self.cached_index[2]
+
+    def segments_between(self, t0, t1):
+        """
+        Returns segments overlapping the time range t0 to t1 in seconds
+        """
+        return self.index().between(t0, t1)
+
+    def segment_at(self, t):
+        """
+        Returns the segment containing time t in seconds, else None
+        """
+        return self.index().at(t)
+
+    def overlaps(self, other):
+        """
+        Returns list of (segment, other_segment) pairs
+        for segments overlapping in time between two transcripts
+        """
+        return list(self.index().overlaps(other.index()))
+
+    def speaker_overlaps(self):
+        """
+        Returns list of (segment, other_segment) pairs
+        for segments from different speakers overlapping in time
+        """
+        return [
+            (seg, other_seg)
+            for seg, other_seg in self.index().self_overlaps()
+            if seg.speaker != other_seg.speaker
+        ]
+
     def text(self):
         """
         Returns unformatted text from all segments
@@ -91,18 +240,25 @@ class time_aligned_text(object):
         )
         return " ".join(_.__str__(data_handler) for _ in self.segments)
 
-    def read(self, file_name):
+    def read(self, file_name, lazy=False):
         """ Read a file using class-specific read function """
         self.file_extension = file_name.split(".")[-1]
         self.location = file_name
         data_handler = importlib.import_module(
             "asrtoolkit.data_handlers.{:}".format(self.file_extension)
         )
-        self.segments = data_handler.read_file(file_name)
+        if lazy and hasattr(data_handler, "read_lazy"):
+            self.segments = data_handler.read_lazy(file_name)
+        else:
+            self.segments = data_handler.read_file(file_name)
 
-    def write(self, file_name):
+    def write(self, file_name, reread=True, buffer_size=WRITE_BUFFER_SIZE):
         """
         Output to file using segment-specific __str__ function
+        Segments are streamed through a buffered writer into a temporary file
+        which then atomically replaces file_name.
+        If 'reread' is False, return an object which defers parsing the new file
+        until its segments are first used.
         """
         file_extension = file_name.split(".")[-1] if "." in file_name else "stm"
 
@@ -111,31 +267,91 @@ class time_aligned_text(object):
         data_handler = importlib.import_module(
             "asrtoolkit.data_handlers.{:}".format(file_extension)
         )
-        with open(file_name, "w", encoding="utf-8") as f:
-            f.write(data_handler.header())
-            f.writelines(
-                data_handler.separator.join(
-                    seg.__str__(data_handler) for seg in self.segments
-                )
-            )
-            f.write(data_handler.footer())
+        tmp_file_name = "{}.{}.tmp".format(file_name, uuid.uuid4().hex)
+        try:
+            if hasattr(data_handler, "write_file"):
+                # binary formats write all segments at once
+                data_handler.write_file(tmp_file_name, self.segments)
+            else:
+                with open(
+                    tmp_file_name, "x", encoding="utf-8", buffering=buffer_size
+                ) as f:
+                    f.write(data_handler.header())
+                    f.writelines(formatted_chunks(data_handler, self.segments))
+                    f.write(data_handler.footer())
+            os.replace(tmp_file_name, file_name)
+        finally:
+            if os.path.exists(tmp_file_name):
+                os.remove(tmp_file_name)
 
-        # return back new object in case we are updating a list in place
-        return time_aligned_text(file_name)
+        if reread:
+            # return back new object in case we are updating a list in place
+            return time_aligned_text(file_name)
 
-    def split(self, target_dir):
+        # segments are read from the new file only if they are used,
+        # so callers see the written (e.g. cleaned) text rather than these segments
+        return time_aligned_text(file_name, deferred=True)
+
+    def split(self, target_dir, archive=False):
         """
         Split transcript into many pieces based on valid segments of transcript
+        All pieces are formatted and written in one pass without re-reading them
+        If 'archive' is True, pieces are packed into one uncompressed tar file
+        alongside a JSON index of each piece's byte offset and size
         """
         os.makedirs(target_dir, exist_ok=True)
-        for iseg, seg in enumerate(self.segments):
-            new_seg = time_aligned_text()
-            new_seg.file_extension = self.file_extension
-            new_seg.location = generate_segmented_file_name(
-                target_dir, self.location, iseg
+        data_handler = importlib.import_module(
+            "asrtoolkit.data_handlers.{:}".format(self.file_extension)
+        )
+
+        if hasattr(data_handler, "write_file"):
+            # binary formats write each piece separately
+            for iseg, seg in enumerate(self.segments):
+                new_seg = time_aligned_text()
+                new_seg.segments = [seg]
+                new_seg.write(
+                    generate_segmented_file_name(target_dir, self.location, iseg),
+                    reread=False,
+                )
+            return
+
+        pieces = (
+            (
+                generate_segmented_file_name(target_dir, self.location, iseg),
+                (
+                    data_handler.header()
+                    + seg.__str__(data_handler)
+                    + data_handler.footer()
+                ).encode("utf-8"),
             )
-            new_seg.segments = [seg]
-            new_seg.write(new_seg.location)
+            for iseg, seg in enumerate(self.segments)
+        )
+
+        if not archive:
+            for file_name, data in pieces:
+                with open(file_name, "wb") as f:
+                    f.write(data)
+            return
+
+        archive_name = sanitize_hyphens(
+            os.path.join(target_dir, basename(strip_extension(self.location)))
+            + "_segments.tar"
+        )
+        index = {}
+        with tarfile.open(archive_name, "w") as tar:
+            for file_name, data in pieces:
+                info = tarfile.TarInfo(basename(file_name))
+                info.size = len(data)
+                info.mtime = int(time.time())
+                # data follows the header block(s) written for this member
+                data_offset = tar.offset + len(
+                    info.tobuf(tar.format, tar.encoding, tar.errors)
+                )
+                tar.addfile(info, io.BytesIO(data))
+                index[info.name] = [data_offset, info.size]
+
+        with open(archive_name + ".json", "w") as f:
+            json.dump(index, f)
 
 
 if __name__ == "__main__":
@@ -3,12 +3,130 @@
 Simple wrapper for general file functions
 """
 
+import hashlib
+import json
+import logging
+import os
+
+# bytes read at a time when hashing files
+HASH_CHUNK_SIZE = 1 << 20
+
+# bytes read from each end of a file when fingerprinting it
+FINGERPRINT_CHUNK_SIZE = 1 << 16
+
+# memoized hashes keyed by file_stat_key
+FILE_HASHES = {}
+
+LOGGER = logging.getLogger(__name__)
+
 
 def make_list_of_dirs(input_dir_list):
     """
     Make an entire list of directories
     """
-    import os
-
     for this_dir in input_dir_list:
         os.makedirs(this_dir, exist_ok=True)
+
+
+def file_stat_key(file_name):
+    """
+    Returns (path, size, mtime_ns, inode) identifying the current contents of a file
+    """
+    stat = os.stat(file_name)
+    return (os.path.realpath(file_name), stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+def sha1_file(file_name, text=False):
+    """
+    Returns a sha1 hash of a file, reading it in chunks
+    If 'text' is True, the file is read as text and hashed as utf-8
+    """
+    sha1 = hashlib.sha1()
+    with open(file_name, "r" if text else "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), "" if text else b""):
+            sha1.update(chunk.encode() if text else chunk)
+    return sha1.hexdigest()
+
+
+def hash_file(file_name, text=False, sidecar=False):
+    """
+    Returns a sha1 hash of a file, computing it at most once per file version
+    If 'sidecar' is True, the hash is also stored in and read from file_name.sha1
+    so that it persists between runs
+    """
+    stat_key = file_stat_key(file_name)
+    key = stat_key + (text,)
+    if key in FILE_HASHES:
+        return FILE_HASHES[key]
+
+    sidecar_file = file_name + ".sha1"
+    if sidecar and os.path.exists(sidecar_file):
+        with open(sidecar_file) as f:
+            stored = json.load(f)
+        if stored.get("key") == list(key[1:]):
+            FILE_HASHES[key] = stored["sha1"]
+            return FILE_HASHES[key]
+
+    FILE_HASHES[key] = sha1_file(file_name, text=text)
+
+    if sidecar:
+        with open(sidecar_file, "w") as f:
+            json.dump({"key": list(key[1:]), "sha1": FILE_HASHES[key]}, f)
+
+    return FILE_HASHES[key]
+
+
+def fingerprint_file(file_name):
+    """
+    Returns a cheap fingerprint of a file from its size and a sha1 of its first and last chunks
+    Files with different fingerprints differ, but equal fingerprints need a full hash
+    """
+    size = os.path.getsize(file_name)
+    sha1 = hashlib.sha1()
+    with open(file_name, "rb") as f:
+        sha1.update(f.read(FINGERPRINT_CHUNK_SIZE))
+        if size > FINGERPRINT_CHUNK_SIZE:
+            f.seek(max(FINGERPRINT_CHUNK_SIZE, size - FINGERPRINT_CHUNK_SIZE))
+            sha1.update(f.read())
+    return size, sha1.hexdigest()
+
+
+def find_duplicates(file_names):
+    """
+    Returns dict mapping the index of each file duplicating an earlier file's contents
+    to the index of the first file with those contents
+    Files are compared by fingerprint and only fully hashed when fingerprints collide
+    """
+    by_fingerprint = {}
+    for i, file_name in enumerate(file_names):
+        by_fingerprint.setdefault(fingerprint_file(file_name), []).append(i)
+
+    duplicates = {}
+    for indices in by_fingerprint.values():
+        if len(indices) > 1:
+            first_with_hash = {}
+            for i in indices:
+                first = first_with_hash.setdefault(hash_file(file_names[i]), i)
+                if first != i:
+                    duplicates[i] = first
+    return duplicates
+
+
+def link_duplicate_files(file_names):
+    """
+    Replaces files duplicating an earlier file's contents with hard links to that file
+    Returns the number of files linked
+    """
+    n_linked = 0
+    for i, first in sorted(find_duplicates(file_names).items()):
+        if os.path.samefile(file_names[i], file_names[first]):
+            continue
+        try:
+            os.link(file_names[first], file_names[i] + ".link")
+            os.replace(file_names[i] + ".link", file_names[i])
+            n_linked += 1
+        except OSError as exc:
+            LOGGER.warning(
+                "Could not link %s to %s: %s", file_names[i], file_names[first], exc
+            )
+    return n_linked
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""
+Module for reading and writing 16 bit mono PCM audio in WAV and NIST SPH files without sox
+
+Headers are parsed in-process and PCM data is memory-mapped, so segments of
+uncompressed files are byte ranges which can be sliced without decoding or copying.
+"""
+
+import contextlib
+import mmap
+import os
+import struct
+import wave
+
+from asrtoolkit.file_utils.name_cleaners import get_extension
+
+# bytes per sample of the 16 bit PCM audio written here
+SAMPLE_WIDTH = 2
+
+# NIST SPH headers are padded to this many bytes
+SPH_HEADER_SIZE = 1024
+
+
+def write_wav(file_name, pcm, sample_rate=16000):
+    " Writes 16 bit little-endian mono PCM bytes to a WAV file "
+    with wave.open(file_name, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(SAMPLE_WIDTH)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm)
+
+
+def write_sph(file_name, pcm, sample_rate=16000):
+    " Writes 16 bit little-endian mono PCM bytes to a NIST SPH file "
+    fields = [
+        "sample_count -i {}".format(len(pcm) // SAMPLE_WIDTH),
+        "sample_n_bytes -i {}".format(SAMPLE_WIDTH),
+        "channel_count -i 1",
+        "sample_byte_format -s2 01",
+        "sample_rate -i {}".format(sample_rate),
+        "sample_coding -s3 pcm",
+        "end_head",
+    ]
+    header = "NIST_1A\n   {}\n{}\n".format(SPH_HEADER_SIZE, "\n".join(fields))
+    with open(file_name, "wb") as f:
+        f.write(header.encode("ascii").ljust(SPH_HEADER_SIZE, b" "))
+        f.write(pcm)
+
+
+PCM_WRITERS = {"wav": write_wav, "sph": write_sph}
+
+# WAV format tags for integer PCM, directly or through WAVE_FORMAT_EXTENSIBLE
+WAV_PCM_FORMATS = (1, 0xFFFE)
+
+
+def read_wav_header(f):
+    """
+    Returns format of an open WAV file as a dict with the offset and size of its data
+    or None if it is not a RIFF WAVE file of integer PCM
+    """
+    riff = f.read(12)
+    if riff[:4] != b"RIFF" or riff[8:] != b"WAVE":
+        return None
+    header = {}
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        chunk_id, chunk_size = struct.unpack("<4sI", chunk)
+        if chunk_id == b"fmt ":
+            fmt = f.read(chunk_size)
+            format_tag, channels, sample_rate, _, _, bits = struct.unpack(
+                "<HHIIHH", fmt[:16]
+            )
+            # extensible formats name their sample format by a GUID starting with the tag
+            if format_tag == 0xFFFE and len(fmt) >= 26:
+                format_tag = struct.unpack("<H", fmt[24:26])[0]
+            if format_tag not in WAV_PCM_FORMATS:
+                return None
+            header.update(
+                channels=channels,
+                sample_rate=sample_rate,
+                sample_width=bits // 8,
+                byte_order="little",
+            )
+            f.seek(chunk_size % 2, os.SEEK_CUR)
+        elif chunk_id == b"data":
+            return dict(header, data_offset=f.tell(), data_size=chunk_size)
+        else:
+            f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+
+def read_sph_header(f):
+    """
+    Returns format of an open NIST SPH file as a dict with the offset and size of its data
+    or None if it is not an uncompressed NIST SPH file of PCM
+    """
+    if f.read(8) != b"NIST_1A\n":
+        return None
+    header_size = int(f.readline())
+    fields = {}
+    for line in f.read(header_size - f.tell()).decode("ascii", "replace").split("\n"):
+        parts = line.split(None, 2)
+        if parts and parts[0] == "end_head":
+            break
+        if len(parts) == 3:
+            fields[parts[0]] = parts[2].strip()
+    sample_width = int(fields.get("sample_n_bytes", 2))
+    if fields.get("sample_coding", "pcm") != "pcm" or "sample_rate" not in fields:
+        return None
+    return {
+        "channels": int(fields.get("channel_count", 1)),
+        "sample_rate": int(fields["sample_rate"]),
+        "sample_width": sample_width,
+        "byte_order": "big" if fields.get("sample_byte_format") == "10" else "little",
+        "data_offset": header_size,
+        "data_size": int(fields["sample_count"]) * sample_width
+        if "sample_count" in fields
+        else None,
+    }
+
+
+PCM_READERS = {"wav": read_wav_header, "sph": read_sph_header}
+
+
+def read_header(file_name):
+    """
+    Returns the format of a WAV or SPH file of uncompressed PCM
+    or None if it cannot be read without sox
+    """
+    reader = PCM_READERS.get(get_extension(file_name).lower())
+    if reader is None:
+        return None
+    with open(file_name, "rb") as f:
+        try:
+            header = reader(f)
+        except (ValueError, struct.error):
+            return None
+    if header:
+        # streamed files may not record their true data size
+        available = os.path.getsize(file_name) - header["data_offset"]
+        if header["data_size"] is None or header["data_size"] > available:
+            header["data_size"] = available
+    return header
+
+
+def is_training_pcm(header, sample_rate=16000):
+    """
+    Returns True if a header describes 16 bit little-endian mono PCM at sample_rate,
+    which can be cut and written without resampling or conversion
+    """
+    return header is not None and (
+        header["channels"],
+        header["sample_rate"],
+        header["sample_width"],
+        header["byte_order"],
+    ) == (1, sample_rate, SAMPLE_WIDTH, "little")
+
+
+@contextlib.contextmanager
+def map_pcm(file_name, header=None):
+    """
+    Memory-maps the PCM data of a WAV or SPH file and yields it as a read-only memoryview
+    Slices of the view are not copied, and numpy.frombuffer(view, "<i2") reads samples
+    of 16 bit little-endian audio as an array without copying them
+    The view and its slices must not be used once the block exits
+    """
+    header = header or read_header(file_name)
+    with open(file_name, "rb") as f:
+        if not header["data_size"]:
+            yield memoryview(b"")
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                start = header["data_offset"]
+                with view[start : start + header["data_size"]] as data:
+                    yield data
+
+
+def can_write(file_name):
+    " Returns True if audio can be written to file_name without sox "
+    return get_extension(file_name).lower() in PCM_WRITERS
+
+
+def write_pcm(file_name, pcm, sample_rate=16000):
+    " Writes 16 bit little-endian mono PCM bytes to a WAV or SPH file by extension "
+    PCM_WRITERS[get_extension(file_name).lower()](file_name, pcm, sample_rate)
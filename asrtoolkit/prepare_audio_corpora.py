@@ -4,22 +4,52 @@ Script for preparing SPH, STM files into training, testing, and development sets
 
 If present, train, test, dev sets will be used from the individual corpora
 """
+import functools
 import json
 import logging
+import os
+import random
 
 from fire import Fire
 
-from asrtoolkit.data_structures.corpus import corpus
-from asrtoolkit.file_utils.common_file_operations import make_list_of_dirs
+from asrtoolkit.data_structures.corpus import corpus, find_exemplar_files
+from asrtoolkit.data_structures.manifest import log_writer
+from asrtoolkit.file_utils.common_file_operations import (
+    find_duplicates,
+    link_duplicate_files,
+    make_list_of_dirs,
+)
 
 LOGGER = logging.getLogger()
 
 data_dirs = ["test", "train", "dev"]
 
 
-def auto_split_corpora(corpora, min_size=50):
+def speaker_disjoint_auto_split(train, min_size, seed=None):
+    """
+    Split a corpus into speaker-disjoint train, dev, and test corpora
+    with dev holding at least min_size segments, when speakers allow,
+    and test holding 20% of the remaining segments
+    """
+    n_segments = train.calculate_number_of_segments()
+    dev_fraction = min(min_size / n_segments, 1) if n_segments else 0
+    return train.stratified_split(
+        {
+            "dev": dev_fraction,
+            "test": (1 - dev_fraction) / 5,
+            "train": (1 - dev_fraction) * 4 / 5,
+        },
+        weight="segments",
+        seed=seed,
+    )
+
+
+def auto_split_corpora(corpora, min_size=50, speaker_disjoint=False, seed=None):
     """
     Given input corpora dict of corpora, auto split if it isn't already split
+    If speaker_disjoint is True, files sharing a speaker are kept in the same split
+    Files are shuffled before splitting; set seed for reproducible splits,
+    otherwise the global random state is used
     """
     all_ready = all(
         corpora[data_dir].validate() if data_dir in corpora else False
@@ -37,26 +67,42 @@ def auto_split_corpora(corpora, min_size=50):
         # first pass, populate train directory
         corpora["train"] += corpora["dev"] + corpora["test"]
 
-        # pick a file from training set to be dev set such that it contains min_size segments
-        corpora["dev"], corpora["train"] = corpora["train"][:1], corpora["train"][1:]
-        while (
-            corpora["dev"].calculate_number_of_segments() < min_size
-            and corpora["train"].validate() > 0
-        ):
+        corpora["train"].validate()
+        # count segments and speakers of every file in one parallel pass
+        corpora["train"].count_stats()
+        if speaker_disjoint:
+            corpora.update(
+                speaker_disjoint_auto_split(corpora["train"], min_size, seed)
+            )
+        else:
+            (random.Random(seed) if seed is not None else random).shuffle(
+                corpora["train"].exemplars
+            )
+
+            # pick files from training set to be dev set such that it contains min_size segments
+            # validating and counting each exemplar once rather than once per file moved
+            train_exemplars = corpora["train"].exemplars
+            n_valid_left = sum(_.validate() for _ in train_exemplars[1:])
+            n_dev = min(1, len(train_exemplars))
+            n_segments = sum(_.count_segments() for _ in train_exemplars[:n_dev])
+            while n_segments < min_size and n_valid_left > 0:
+                n_valid_left -= train_exemplars[n_dev].validate()
+                n_segments += train_exemplars[n_dev].count_segments()
+                n_dev += 1
             corpora["dev"], corpora["train"] = (
-                (corpora["dev"] + corpora["train"][:1]),
-                corpora["train"][1:],
+                corpora["train"][:n_dev],
+                corpora["train"][n_dev:],
             )
 
-        # pick 20% for testing
-        split_index = len(corpora["train"].exemplars) * 4 // 5
-        corpora["test"] = corpora["train"][split_index:]
-        corpora["train"] = corpora["train"][:split_index]
+            # pick 20% for testing
+            split_index = len(corpora["train"].exemplars) * 4 // 5
+            corpora["test"] = corpora["train"][split_index:]
+            corpora["train"] = corpora["train"][:split_index]
 
-        # ensure no duplicates
-        corpora["train"] -= corpora["test"]
-        corpora["test"] -= corpora["dev"]
-        corpora["train"] -= corpora["dev"]
+            # ensure no duplicates
+            corpora["train"] -= corpora["test"]
+            corpora["test"] -= corpora["dev"]
+            corpora["train"] -= corpora["dev"]
 
     if (
         corpora["dev"].calculate_number_of_segments() < min_size
@@ -70,42 +116,176 @@ def auto_split_corpora(corpora, min_size=50):
         return corpora
 
 
-def get_corpus(loc):
+def get_corpus(loc, use_manifest=False):
     """ returns corpus for input location """
-    return corpus({"location": loc})
-
-
-def prep_all_for_training(corpora, target_dir, nested, sample_rate=16000):
+    return corpus({"location": loc, "use_manifest": use_manifest})
+
+
+def prep_all_for_training(
+    corpora,
+    target_dir,
+    nested,
+    sample_rate=16000,
+    resume=False,
+    shard=None,
+    log=None,
+    **scheduler_options,
+):
     """
     prepare all corpora for training and return logs of what was where
+    If shard is an (index, count) pair, only exemplars assigned to that shard are prepared
+    If log is a log_writer, records are streamed to it with their split as each
+    exemplar completes, rather than returned
+    scheduler_options (threads, processes, window, timeout, retries) configure the scheduler
     """
-    return {
-        data_dir: corpora[data_dir].prepare_for_training(
-            target_dir + "/" + data_dir, nested, sample_rate
+    logs = {
+        data_dir: (
+            corpora[data_dir].shard(*shard) if shard else corpora[data_dir]
+        ).prepare_for_training(
+            target_dir + "/" + data_dir,
+            nested,
+            sample_rate,
+            resume,
+            shard,
+            log and functools.partial(log.write, split=data_dir),
+            **scheduler_options,
         )
         for data_dir in data_dirs
     }
+    return None if log else logs
 
 
-def gather_all_corpora(corpora_dirs):
+def corpora_log_location(target_dir, shard=None):
+    """
+    Returns path of the JSONL log of prepared corpora in target_dir
+    for all exemplars or, if given, an (index, count) shard
+    """
+    if shard is None:
+        return target_dir + "/corpora.jsonl"
+    return target_dir + "/corpora.shard-{}-of-{}.jsonl".format(*shard)
+
+
+def link_prepared_duplicates(target_dir):
+    """
+    Replace prepared audio files in target_dir duplicating another with hard links to it
+    """
+    n_linked = link_duplicate_files(
+        [
+            audio_file_name
+            for data_dir in data_dirs
+            for audio_file_name, _ in find_exemplar_files(target_dir + "/" + data_dir)
+        ]
+    )
+    LOGGER.info("Linked %d duplicate audio files in %s", n_linked, target_dir)
+    return n_linked
+
+
+def merge_shard_logs(target_dir="input-data", num_shards=1, link_duplicates=False):
+    """
+    Combine the corpora logs written by each shard in target_dir into corpora.jsonl
+    Raises ValueError if a shard's log is missing or a file was prepared by two shards
+    Files duplicating audio already merged and lines truncated by a crash are skipped
+    Returns the number of merged records
+
+    Input
+        target-dir, str - target directory the shards were prepared into
+        num-shards, int - number of shards the corpora were prepared in
+        link-duplicates, bool (default False) - if present/True, replace prepared audio files duplicating another with hard links to it
+    """
+    locations = [
+        corpora_log_location(target_dir, (shard_index, num_shards))
+        for shard_index in range(num_shards)
+    ]
+    for location in locations:
+        if not os.path.exists(location):
+            raise ValueError("shard log {} is missing".format(location))
+
+    n_records = 0
+    prepared_by, audio_hashes = {}, set()
+    with open(corpora_log_location(target_dir) + ".tmp", "w") as merged:
+        for shard_index, location in enumerate(locations):
+            with open(location) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    name = record["audio_file"]
+                    if prepared_by.setdefault(name, shard_index) != shard_index:
+                        raise ValueError(
+                            "{} was prepared by shards {} and {}".format(
+                                name, prepared_by[name], shard_index
+                            )
+                        )
+                    # as within a shard, only the first file with the same audio is logged
+                    if record["audio_file_hash"] not in audio_hashes:
+                        audio_hashes.add(record["audio_file_hash"])
+                        merged.write(json.dumps(record) + "\n")
+                        n_records += 1
+    os.replace(
+        corpora_log_location(target_dir) + ".tmp", corpora_log_location(target_dir)
+    )
+    if link_duplicates:
+        link_prepared_duplicates(target_dir)
+    return n_records
+
+
+def deduplicate_corpora(corpora):
+    """
+    Removes exemplars whose audio duplicates audio in another corpus or the same one
+    Duplicates are kept in test, then dev, then train, so held out data does not leak
+    Returns the number of exemplars removed
+    """
+    names = [name for name in ["test", "dev", "train", "unsorted"] if name in corpora]
+    exemplars = [(name, eg) for name in names for eg in corpora[name].exemplars]
+    duplicates = find_duplicates([eg.audio_file.location for _, eg in exemplars])
+    for name in names:
+        corpora[name].exemplars = [
+            eg
+            for i, (split, eg) in enumerate(exemplars)
+            if split == name and i not in duplicates
+        ]
+    return len(duplicates)
+
+
+def gather_all_corpora(corpora_dirs, use_manifest=False, dedupe=True):
     """
     Finds all existing corpora and gathers into a dictionary
+    If dedupe is True, exemplars with audio duplicated across corpora are only kept once
     """
 
-    corpora = {
-        data_dir: get_corpus(corpus_dir + "/" + data_dir)
-        for corpus_dir in corpora_dirs
-        for data_dir in data_dirs
-    }
+    corpora = {data_dir: corpus() for data_dir in data_dirs}
+    for corpus_dir in corpora_dirs:
+        for data_dir in data_dirs:
+            corpora[data_dir] += get_corpus(corpus_dir + "/" + data_dir, use_manifest)
 
     corpora["unsorted"] = corpus()
-    for unsorted_corpus in list(map(get_corpus, corpora_dirs)):
+    for unsorted_corpus in [get_corpus(_, use_manifest) for _ in corpora_dirs]:
         corpora["unsorted"] += unsorted_corpus
+
+    if dedupe:
+        LOGGER.info("Removed %d duplicate exemplars", deduplicate_corpora(corpora))
     return corpora
 
 
 def prepare_audio_corpora(
-    *corpora, target_dir="input-data", nested=False, min_train_dev_segments=50
+    *corpora,
+    target_dir="input-data",
+    nested=False,
+    min_train_dev_segments=50,
+    use_manifest=False,
+    resume=False,
+    threads=None,
+    processes=None,
+    window=64,
+    timeout=None,
+    retries=0,
+    speaker_disjoint=False,
+    seed=None,
+    shard_index=0,
+    num_shards=1,
+    dedupe=True,
+    link_duplicates=False,
 ):
     """
     Copy and organize specified corpora into a target directory.
@@ -116,7 +296,25 @@ def prepare_audio_corpora(
         target-dir, str - target directory where corpora should be organized
         nested, bool (default False) - if present/True, store in stm and sph subdirectories
         min_train_dev_segments int - enforces a minimum number of speech segments in train and dev splits
+        use_manifest, bool (default False) - if present/True, cache per-file stats in a manifest in each corpus directory
+        resume, bool (default False) - if present/True, skip exemplars already prepared by a previous run, as recorded in a journal in each target split directory
+        threads, int - number of threads running sox (default: executor default)
+        processes, int - number of processes rewriting transcripts (default: number of CPUs, 0 to use threads)
+        window, int (default 64) - maximum number of exemplars in flight at once
+        timeout, float - seconds after which a sox run is killed and a task is abandoned
+        retries, int (default 0) - number of times a failed task is retried
+        speaker_disjoint, bool (default False) - if present/True, automatic splits keep files sharing a speaker in the same split
+        seed, int - seed for shuffling files into automatic splits, for reproducible splits
+        shard_index, int (default 0) - index of the shard of exemplars this run prepares
+        num_shards, int (default 1) - number of shards, each prepared by a separate run
+            with the same arguments and a seed, then combined by merge_shard_logs
+        dedupe, bool (default True) - only prepare one of the files with the same audio across all corpora
+        link_duplicates, bool (default False) - if present/True, replace prepared audio files duplicating another with hard links to it,
+            once every shard has finished when sharded
     """
+    if num_shards > 1 and seed is None:
+        raise ValueError("a seed is required so that every shard splits corpora alike")
+    shard = (shard_index, num_shards) if num_shards > 1 or shard_index else None
 
     make_list_of_dirs(
         [
@@ -126,17 +324,40 @@ def prepare_audio_corpora(
         ]
     )
 
-    corpora = gather_all_corpora(corpora)
-    corpora = auto_split_corpora(corpora, min_size=min_train_dev_segments)
+    corpora = gather_all_corpora(corpora, use_manifest, dedupe)
+    corpora = auto_split_corpora(
+        corpora,
+        min_size=min_train_dev_segments,
+        speaker_disjoint=speaker_disjoint,
+        seed=seed,
+    )
+
+    with log_writer(corpora_log_location(target_dir, shard)) as log:
+        prep_all_for_training(
+            corpora,
+            target_dir,
+            nested,
+            resume=resume,
+            shard=shard,
+            log=log,
+            threads=threads,
+            processes=processes,
+            window=window,
+            timeout=timeout,
+            retries=retries,
+        )
 
-    log = prep_all_for_training(corpora, target_dir, nested)
-    with open(target_dir + "/corpora.json", "w") as f:
-        f.write(json.dumps(log))
+    if link_duplicates and not shard:
+        link_prepared_duplicates(target_dir)
 
 
 def cli():
     Fire(prepare_audio_corpora)
 
 
+def merge_cli():
+    Fire(merge_shard_logs)
+
+
 if __name__ == "__main__":
     cli()
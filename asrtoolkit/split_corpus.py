@@ -27,6 +27,58 @@ def log_corpus_creation(corp, name):
     )
 
 
+def speaker_disjoint_split(
+    corpus_to_split,
+    split_words,
+    min_split_segs,
+    split_duration=None,
+    weight="words",
+):
+    """
+    Split a corpus so that no speaker appears on both sides
+    The split targets the largest fraction of the corpus needed to meet the
+    split_words, min_split_segs, and split_duration quotas, measured in weight
+    Returns the remaining corpus and the new split
+    """
+    valid_exemplars, total_words = corpus_to_split.count_exemplar_words()
+    if split_words < 0 or split_words > total_words or not total_words:
+        raise ValueError(
+            "cannot split corpus with {} words into split with {} words".format(
+                total_words, split_words
+            )
+        )
+    total_segments = sum(eg.count_segments() for eg in valid_exemplars)
+    fractions = [split_words / total_words, min_split_segs / total_segments]
+    if split_duration is not None:
+        total_duration = sum(eg.speech_duration() for eg in valid_exemplars)
+        if split_duration > total_duration:
+            raise ValueError(
+                "cannot split corpus with {} seconds of speech into split with {} seconds".format(
+                    total_duration, split_duration
+                )
+            )
+        fractions.append(split_duration / total_duration)
+    fraction = min(max(fractions), 1)
+
+    splits = corpus_to_split.stratified_split(
+        {"split": fraction, "remaining": 1 - fraction}, weight=weight
+    )
+    new_corpus = splits["split"]
+    if (
+        sum(eg.n_words for eg in new_corpus.exemplars) < split_words
+        or new_corpus.calculate_number_of_segments() < min_split_segs
+        or (
+            split_duration is not None
+            and sum(eg.speech_duration() for eg in new_corpus.exemplars)
+            < split_duration
+        )
+    ):
+        LOGGER.warning(
+            "Speaker-disjoint split falls short of its quotas since speakers cannot be divided"
+        )
+    return splits["remaining"], new_corpus
+
+
 def perform_split(
     corpus_to_split,
     split_dir,
@@ -34,14 +86,30 @@ def perform_split(
     split_words,
     min_split_segs,
     leftover_data_split_name,
+    split_duration=None,
+    speaker_disjoint=False,
+    weight="words",
+    shard=None,
 ):
-    leftover_corpus, new_corpus = corpus_to_split.split(split_words, min_split_segs)
+    if speaker_disjoint:
+        leftover_corpus, new_corpus = speaker_disjoint_split(
+            corpus_to_split, split_words, min_split_segs, split_duration, weight
+        )
+    else:
+        leftover_corpus, new_corpus = corpus_to_split.split(
+            split_words, min_split_segs, split_duration
+        )
+
+    # when sharded, every node makes the same split and prepares its own shard of it
+    if shard:
+        new_corpus = new_corpus.shard(*shard)
+        leftover_corpus = leftover_corpus.shard(*shard)
 
-    new_corpus.prepare_for_training(os.path.join(split_dir, split_name))
+    new_corpus.prepare_for_training(os.path.join(split_dir, split_name), shard=shard)
     log_corpus_creation(new_corpus, split_name)
 
     leftover_corpus.prepare_for_training(
-        os.path.join(split_dir, leftover_data_split_name)
+        os.path.join(split_dir, leftover_data_split_name), shard=shard
     )
     log_corpus_creation(leftover_corpus, leftover_data_split_name)
 
@@ -54,32 +122,59 @@ def split_corpus(
     min_split_segs=10,
     leftover_data_split_name="orig",
     rand_seed=None,
+    use_manifest=False,
+    split_duration=None,
+    speaker_disjoint=False,
+    weight="words",
+    shard_index=0,
+    num_shards=1,
 ):
     """
     Splits an ASR corpus directory based on number of words outputting splits in split_dir.
     At least 1000 words is recommended for dev or tests splits to make WER calculations significant ~0.1%
     Invalid files, such as empty files, will not be included in data splits.
 
+    Set split_duration to also require more than that many seconds of speech in the split
+    Set speaker_disjoint to keep all files sharing a speaker on the same side of the split,
+      targeting the fraction of the corpus needed to meet every quota
+    Set weight to "words", "duration", or "segments" to choose how speaker-disjoint splits
+      measure that fraction
     Set rand_seed for reproducible splits
+    Set use_manifest to cache per-file stats in a manifest in in_dir for faster reloading
+    Set num_shards and shard_index to prepare only one shard of the split's files,
+      running once per shard index with the same arguments and rand_seed
     """
+    if num_shards > 1 and rand_seed is None:
+        raise ValueError("a rand_seed is required so that every shard splits alike")
+    shard = (shard_index, num_shards) if num_shards > 1 or shard_index else None
     seed(rand_seed)
 
-    c = corpus({"location": in_dir})
+    c = corpus({"location": in_dir, "use_manifest": use_manifest})
     LOGGER.debug("%d exemplars before validating them", len(c.exemplars))
-    valid_exemplars, total_words = c.count_exemplar_words()
-    c.exemplars = valid_exemplars
-    LOGGER.debug("%d exemplars after validating them", len(valid_exemplars))
+    # count stats of every exemplar in one parallel pass, cached for the split below
+    stats = c.stats()
+    c.exemplars = [eg for eg in c.exemplars if eg.has_stats() and eg.validate()]
+    LOGGER.debug("%d exemplars after validating them", len(c.exemplars))
 
-    if min_split_segs > c.calculate_number_of_segments():
+    if min_split_segs > stats["segments"]:
         LOGGER.error(
             "Not enough valid segments in corpus, %d, to make a split with %d segments. Reduce min_split_segs or get more data",
-            c.calculate_number_of_segments(),
+            stats["segments"],
             min_split_segs,
         )
         sys.exit(1)
 
     perform_split(
-        c, split_dir, split_name, split_words, min_split_segs, leftover_data_split_name
+        c,
+        split_dir,
+        split_name,
+        split_words,
+        min_split_segs,
+        leftover_data_split_name,
+        split_duration,
+        speaker_disjoint,
+        weight,
+        shard,
     )
 
 
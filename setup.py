@@ -78,6 +78,7 @@ setup(
             "convert_transcript = asrtoolkit.convert_transcript:cli",
             "degrade_audio_file=asrtoolkit.degrade_audio_file:cli",
             "extract_excel_spreadsheets=asrtoolkit.extract_excel_spreadsheets:main",
+            "merge_shard_logs=asrtoolkit.prepare_audio_corpora:merge_cli",
             "prepare_audio_corpora=asrtoolkit.prepare_audio_corpora:cli",
             "split_audio_file=asrtoolkit.split_audio_file:cli",
             "wer=asrtoolkit.wer:cli",
@@ -4,6 +4,9 @@ Test file conversion using samples
 """
 import os
 import hashlib
+import shutil
+
+from asrtoolkit.convert_transcript import convert_directory
 
 from asrtoolkit.data_structures.time_aligned_text import time_aligned_text
 from utils import get_sample_dir, get_test_dir
@@ -65,6 +68,42 @@ def test_json_to_rttm_conversion():
     convert_and_test_it_loads(transcript, f"{test_dir}/json_to_rttm_test.rttm")
 
 
+def test_rttm_times_and_speaker_overlaps():
+    " execute rttm reader test for stop times and overlapping speakers "
+
+    rttm_file = f"{test_dir}/speaker_overlap_test.rttm"
+    with open(rttm_file, "w") as f:
+        f.write(
+            "SPEAKER call 1 0.50 2.25 <NA> <NA> alice <NA> <NA>\n"
+            "SPEAKER call 1 2.00 1.00 <NA> <NA> bob <NA> <NA>\n"
+            "SPEAKER call 1 3.50 1.00 <NA> <NA> alice <NA> <NA>\n"
+        )
+
+    transcript = time_aligned_text(rttm_file)
+    assert [(_.start, _.stop) for _ in transcript.segments] == [
+        ("0.50", "2.75"),
+        ("2.00", "3.00"),
+        ("3.50", "4.50"),
+    ]
+    assert [(a.speaker, b.speaker) for a, b in transcript.speaker_overlaps()] == [
+        ("alice", "bob")
+    ]
+
+    # millisecond times survive a round trip
+    with open(rttm_file, "w") as f:
+        f.write("SPEAKER call 1 0.125 2.250 <NA> <NA> alice <NA> <NA>\n")
+    transcript = time_aligned_text(rttm_file)
+    assert (transcript.segments[0].start, transcript.segments[0].stop) == (
+        "0.125",
+        "2.375",
+    )
+    transcript.write(rttm_file)
+    with open(rttm_file) as f:
+        assert f.read().split()[3:5] == ["0.125", "2.250"]
+
+    os.remove(rttm_file)
+
+
 def test_json_to_rttm_conversion_without_speaker():
     """
     execute json to rttm test
@@ -74,6 +113,110 @@ def test_json_to_rttm_conversion_without_speaker():
     convert_and_test_it_loads(transcript, f"{test_dir}/no_speaker.rttm")
 
 
+def test_stm_to_tat_conversion():
+    " execute stm to tat test and check the round trip "
+
+    transcript = time_aligned_text(f"{sample_dir}/BillGatesTEDTalk.stm")
+    transcript.write(f"{test_dir}/stm_to_tat_test.tat")
+    reloaded = time_aligned_text(f"{test_dir}/stm_to_tat_test.tat")
+
+    fields = ("filename", "channel", "speaker", "start", "stop", "label", "text")
+    assert [[getattr(_, f) for f in fields] for _ in reloaded.segments] == [
+        [getattr(_, f) for f in fields] for _ in transcript.segments
+    ]
+    os.remove(f"{test_dir}/stm_to_tat_test.tat")
+
+
+def test_write_without_reread():
+    " execute atomic write test returning a transcript read on first use "
+
+    transcript = time_aligned_text(f"{sample_dir}/BillGatesTEDTalk.json")
+    output_dir = f"{test_dir}/write-test"
+    os.makedirs(output_dir, exist_ok=True)
+
+    written = transcript.write(f"{output_dir}/write-test.stm", reread=False)
+    assert written.location == f"{output_dir}/write_test.stm"
+    assert written.deferred
+    assert os.listdir(output_dir) == ["write_test.stm"]
+    # segments match the written file, not the unformatted input
+    assert [_.text for _ in written.segments] == [
+        _.text for _ in time_aligned_text(written.location).segments
+    ]
+    assert [_.text for _ in written.segments] != [_.text for _ in transcript.segments]
+
+    shutil.rmtree(output_dir)
+
+
+def test_stm_normalized_segments():
+    " execute stm writer test for segments flagged as already unformatted "
+    from asrtoolkit.data_handlers import stm
+
+    transcript = time_aligned_text(f"{sample_dir}/invalid.stm")
+    assert [_.normalized for _ in transcript.segments] == [False, True, False]
+
+    lines = stm.format_segments(transcript.segments).splitlines()
+    assert lines[-1].endswith("<o,f0,male> testing testing one two three")
+    assert lines == [stm.format_segment(_) for _ in transcript.segments]
+
+    # modified text is cleaned again
+    transcript.segments[1].text = "Testing 2"
+    assert not transcript.segments[1].normalized
+    assert stm.format_segment(transcript.segments[1]).endswith(" testing two")
+
+
+def test_html_fast_path_matches_beautifulsoup():
+    " execute html reader test against the BeautifulSoup fallback "
+    from bs4 import BeautifulSoup
+
+    from asrtoolkit.data_handlers import html
+
+    with open(f"{sample_dir}/BillGatesTEDTalk.html", encoding="utf-8") as f:
+        input_data = f.read()
+
+    fast_segments = html.read_asrtoolkit_html(input_data)
+    table = BeautifulSoup(input_data, "html.parser").find("table", {})
+    slow_segments = [_ for _ in map(html.parse_line, table.findAll("tr")) if _]
+
+    assert len(fast_segments) == len(slow_segments)
+    assert all(a.__dict__ == b.__dict__ for a, b in zip(fast_segments, slow_segments))
+
+
+def test_directory_conversion():
+    " execute bulk conversion test "
+    import pytest
+
+    input_dir = f"{test_dir}/convert-dir/input"
+    output_dir = f"{test_dir}/convert-dir/output"
+    os.makedirs(f"{input_dir}/nested", exist_ok=True)
+    shutil.copy(f"{sample_dir}/BillGatesTEDTalk.json", input_dir)
+    shutil.copy(f"{sample_dir}/simple_test.json", f"{input_dir}/nested")
+
+    summary = convert_directory(input_dir, output_dir, "stm", jobs=2)
+    assert summary == {"converted": 2, "skipped": 0, "failed": 0, "collided": 0}
+    time_aligned_text(f"{output_dir}/BillGatesTEDTalk.stm")
+    time_aligned_text(f"{output_dir}/nested/simple_test.stm")
+
+    summary = convert_directory(input_dir, output_dir, "stm", jobs=2)
+    assert summary == {"converted": 0, "skipped": 2, "failed": 0, "collided": 0}
+
+    # outputs inside the input tree are not converted again
+    summary = convert_directory(input_dir, f"{input_dir}/out", "vtt", jobs=2)
+    assert summary == {"converted": 2, "skipped": 0, "failed": 0, "collided": 0}
+    summary = convert_directory(input_dir, f"{input_dir}/out", "vtt", jobs=2)
+    assert summary == {"converted": 0, "skipped": 2, "failed": 0, "collided": 0}
+    assert not os.path.exists(f"{input_dir}/out/out")
+    shutil.rmtree(f"{input_dir}/out")
+
+    # inputs sharing a name are only converted once, and never in place
+    shutil.copy(f"{sample_dir}/BillGatesTEDTalk.stm", input_dir)
+    summary = convert_directory(input_dir, f"{test_dir}/convert-dir/other", "srt")
+    assert summary == {"converted": 2, "skipped": 0, "failed": 0, "collided": 1}
+    with pytest.raises(ValueError):
+        convert_directory(input_dir, input_dir, "stm")
+
+    shutil.rmtree(f"{test_dir}/convert-dir")
+
+
 def convert_and_test_it_loads(transcript_obj, output_filename):
     """
     Tests that conversion works
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Test cached file hashing
+"""
+import hashlib
+import os
+import shutil
+
+from asrtoolkit.data_structures.audio_file import audio_file
+from asrtoolkit.file_utils.common_file_operations import (
+    FILE_HASHES,
+    FINGERPRINT_CHUNK_SIZE,
+    file_stat_key,
+    find_duplicates,
+    link_duplicate_files,
+)
+from utils import get_test_dir
+
+test_dir = get_test_dir(__file__)
+
+
+def test_audio_file_hash_is_cached():
+    " execute hashing test with in-memory and sidecar caches "
+    audio_file_name = f"{test_dir}/hash-test.mp3"
+    shutil.copy(f"{test_dir}/small-test-file.mp3", audio_file_name)
+
+    with open(audio_file_name, "rb") as f:
+        expected = hashlib.sha1(f.read()).hexdigest()
+
+    audio = audio_file(audio_file_name)
+    assert audio.hash(sidecar=True) == expected
+    assert FILE_HASHES[file_stat_key(audio_file_name) + (False,)] == expected
+    assert os.path.exists(audio_file_name + ".sha1")
+
+    # sidecar is reused once the in-memory cache is gone
+    FILE_HASHES.clear()
+    assert audio.hash(sidecar=True) == expected
+    with open(audio_file_name + ".sha1") as f:
+        sidecar = f.read()
+
+    # changed contents are hashed again
+    with open(audio_file_name, "ab") as f:
+        f.write(b"\0")
+    assert audio.hash(sidecar=True) != expected
+    with open(audio_file_name + ".sha1") as f:
+        assert f.read() != sidecar
+
+    os.remove(audio_file_name)
+    os.remove(audio_file_name + ".sha1")
+
+
+def test_find_and_link_duplicates():
+    " duplicates are found by fingerprint and confirmed by a full hash "
+    dup_dir = f"{test_dir}/duplicates"
+    os.makedirs(dup_dir, exist_ok=True)
+    head, middle, tail = (bytes([i]) * FINGERPRINT_CHUNK_SIZE for i in range(3))
+    contents = [head + middle + tail, head + tail + tail, head + middle + tail, b"a"]
+    file_names = []
+    for i, content in enumerate(contents):
+        file_names.append(f"{dup_dir}/{i}.sph")
+        with open(file_names[-1], "wb") as f:
+            f.write(content)
+    # files 0 and 1 share a fingerprint but differ in the middle
+    FILE_HASHES.clear()
+    assert find_duplicates(file_names) == {2: 0}
+    assert len(FILE_HASHES) == 3
+
+    assert link_duplicate_files(file_names) == 1
+    assert os.path.samefile(file_names[0], file_names[2])
+    assert not os.path.samefile(file_names[0], file_names[1])
+    # already linked files are left alone
+    assert link_duplicate_files(file_names) == 0
+
+    shutil.rmtree(dup_dir)
+
+
+if __name__ == "__main__":
+    import sys
+
+    import pytest
+
+    pytest.main(sys.argv)
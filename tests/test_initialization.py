@@ -57,6 +57,30 @@ def test_txt_initialization():
     assert reference_sha == new_sha
 
 
+def test_lazy_stm_initialization():
+    " execute lazy loading test "
+
+    eager = time_aligned_text(f"{sample_dir}/BillGatesTEDTalk_transcribed.stm")
+    lazy = time_aligned_text(
+        f"{sample_dir}/BillGatesTEDTalk_transcribed.stm", lazy=True
+    )
+
+    assert len(lazy.segments) == len(eager.segments)
+    assert lazy.segments[10].text == eager.segments[10].text
+    assert [_.text for _ in lazy.segments[5:8]] == [
+        _.text for _ in eager.segments[5:8]
+    ]
+    assert lazy.text() == eager.text()
+
+    # invalid lines are skipped so indices match an eager read
+    eager = time_aligned_text(f"{sample_dir}/BillGatesTEDTalk.stm")
+    lazy = time_aligned_text(f"{sample_dir}/BillGatesTEDTalk.stm", lazy=True)
+    assert lazy.segments[3].text == eager.segments[3].text
+    assert len(lazy.segments) == len(eager.segments)
+    assert [_.text for _ in lazy.segments] == [_.text for _ in eager.segments]
+    assert lazy.segments[-1].text == eager.segments[-1].text
+
+
 if __name__ == "__main__":
     import sys
 
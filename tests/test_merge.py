@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+"""
+Test merging transcripts
+"""
+
+from asrtoolkit.data_structures.time_aligned_text import time_aligned_text
+from utils import get_sample_dir
+
+sample_dir = get_sample_dir(__file__)
+
+
+def test_merge_matches_sorted_concatenation():
+    " execute merge test against sorting all segments "
+
+    transcript = time_aligned_text(f"{sample_dir}/BillGatesTEDTalk_transcribed.stm")
+    pieces = [time_aligned_text() for _ in range(3)]
+    for i, piece in enumerate(pieces):
+        piece.file_extension = "stm"
+        piece.segments = transcript.segments[i::3]
+
+    merged = time_aligned_text.merge(*pieces)
+
+    assert merged.file_extension == "stm"
+    assert merged.segments == sorted(
+        transcript.segments, key=lambda s: (float(s.start), float(s.stop))
+    )
+    assert (pieces[0] + pieces[1] + pieces[2]).segments == merged.segments
+
+
+if __name__ == "__main__":
+    import sys
+
+    import pytest
+
+    pytest.main(sys.argv)
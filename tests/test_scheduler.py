@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Test scheduler for corpus preparation
+"""
+import time
+
+from asrtoolkit.data_structures.scheduler import scheduler
+
+
+def test_scheduler_window():
+    """ Test jobs are only consumed as the window allows """
+    consumed = []
+
+    def jobs():
+        for i in range(10):
+            consumed.append(i)
+            yield [("thread", abs, -i)]
+
+    results = []
+    with scheduler(processes=0, window=3) as schedule:
+        for position, result in schedule.map(jobs(), total=10):
+            results.append((position, result))
+            assert len(consumed) - len(results) <= 3
+    assert sorted(results) == [(i, [i]) for i in range(10)]
+
+
+def test_scheduler_completion_order():
+    """ Test jobs are yielded as they finish rather than in submission order """
+
+    def slow(x):
+        time.sleep(x)
+        return x
+
+    with scheduler(processes=0, threads=2) as schedule:
+        results = list(schedule.map([[("thread", slow, 0.3)], [("thread", slow, 0)]]))
+    assert results == [(1, [0]), (0, [0.3])]
+
+
+def test_scheduler_retries():
+    """ Test failed tasks are retried """
+    attempts = []
+
+    def flaky(x):
+        attempts.append(x)
+        if len(attempts) < 3:
+            raise ValueError("flaky")
+        return x
+
+    with scheduler(processes=0, retries=1) as schedule:
+        assert list(schedule.map([[("thread", flaky, 1)]])) == [(0, [None])]
+    assert len(attempts) == 2
+
+    with scheduler(processes=0, retries=2) as schedule:
+        assert list(schedule.map([[("thread", flaky, 1)]])) == [(0, [1])]
+    assert len(attempts) == 3
+
+
+def test_scheduler_timeout():
+    """ Test running tasks which time out are abandoned rather than retried """
+    attempts = []
+
+    def slow(x):
+        attempts.append(x)
+        time.sleep(x)
+        return x
+
+    start = time.time()
+    with scheduler(processes=0, threads=2, timeout=0.1, retries=2) as schedule:
+        results = list(schedule.map([[("thread", slow, 0.5)], [("thread", slow, 0)]]))
+    assert sorted(results, key=lambda _: _[0]) == [(0, [None]), (1, [0])]
+    assert sorted(attempts) == [0, 0.5]
+    # shutting down does not wait for the abandoned task
+    assert time.time() - start < 0.5
+
+
+if __name__ == "__main__":
+    import sys
+
+    import pytest
+
+    pytest.main(sys.argv)
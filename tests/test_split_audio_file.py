@@ -2,8 +2,12 @@
 """
 Test audio file splitter
 """
+
+import json
 import os
+import shutil
 
+from asrtoolkit.data_structures.time_aligned_text import time_aligned_text
 from asrtoolkit.split_audio_file import split_audio_file
 from utils import get_test_dir
 
@@ -27,6 +31,104 @@ def test_split_audio_file():
     }
 
 
+def test_split_transcript_archive():
+    """
+    Test packing split transcripts into one indexed archive
+    """
+    transcript = time_aligned_text(f"{test_dir}/small-test-file.stm")
+    transcript.split(f"{test_dir}/split-archive", archive=True)
+
+    archive = f"{test_dir}/split-archive/small_test_file_segments.tar"
+    with open(archive + ".json") as f:
+        index = json.load(f)
+    assert set(index) == {
+        "small_test_file_seg_00000.stm",
+        "small_test_file_seg_00001.stm",
+    }
+
+    offset, size = index["small_test_file_seg_00001.stm"]
+    with open(archive, "rb") as f:
+        f.seek(offset)
+        assert f.read(size).decode().startswith("small_test_file 1 gk_speaker 5.01")
+
+    shutil.rmtree(f"{test_dir}/split-archive")
+
+
+def test_write_pcm():
+    """
+    Test writing PCM audio to WAV and SPH files without sox
+    """
+    import wave
+
+    from asrtoolkit.file_utils.pcm_files import SPH_HEADER_SIZE, write_pcm
+
+    pcm = bytes(range(200))
+    write_pcm(f"{test_dir}/pcm-test.wav", pcm, 8000)
+    with wave.open(f"{test_dir}/pcm-test.wav") as f:
+        assert (f.getnchannels(), f.getsampwidth(), f.getframerate()) == (1, 2, 8000)
+        assert f.readframes(f.getnframes()) == pcm
+
+    write_pcm(f"{test_dir}/pcm-test.sph", pcm, 8000)
+    with open(f"{test_dir}/pcm-test.sph", "rb") as f:
+        header = f.read(SPH_HEADER_SIZE).decode()
+        assert f.read() == pcm
+    assert header.startswith("NIST_1A\n   1024\n")
+    assert "sample_count -i 100\n" in header
+    assert "sample_rate -i 8000\n" in header
+
+    os.remove(f"{test_dir}/pcm-test.wav")
+    os.remove(f"{test_dir}/pcm-test.sph")
+
+
+def test_split_pcm_audio_without_sox():
+    """
+    Test WAV and SPH files already in training format are cut from memory-mapped data
+    """
+    import struct
+    import wave
+
+    from asrtoolkit.data_structures.audio_file import audio_file, cut_utterance
+    from asrtoolkit.file_utils.pcm_files import (
+        is_training_pcm,
+        map_pcm,
+        read_header,
+        write_pcm,
+    )
+
+    pcm_dir = f"{test_dir}/pcm-split"
+    os.makedirs(pcm_dir, exist_ok=True)
+    pcm = b"".join(struct.pack("<h", i % 32768) for i in range(16000 * 8))
+    write_pcm(f"{pcm_dir}/small-test-file.wav", pcm)
+    write_pcm(f"{pcm_dir}/eight-khz.wav", pcm, 8000)
+
+    header = read_header(f"{pcm_dir}/small-test-file.wav")
+    assert is_training_pcm(header)
+    assert not is_training_pcm(read_header(f"{pcm_dir}/eight-khz.wav"))
+    assert read_header(f"{test_dir}/small-test-file.mp3") is None
+    with map_pcm(f"{pcm_dir}/small-test-file.wav") as data:
+        assert data[:4] == pcm[:4]
+
+    split_audio_file(
+        f"{pcm_dir}/small-test-file.wav",
+        f"{test_dir}/small-test-file.stm",
+        f"{pcm_dir}/split",
+    )
+    with wave.open(f"{pcm_dir}/split/small_test_file_seg_00001.wav") as f:
+        # the transcript stores times to hundredths of a second
+        assert f.readframes(f.getnframes()) == pcm[501 * 320 : 697 * 320]
+
+    # a prepared SPH file is cut from its own header and data
+    sph = audio_file(f"{pcm_dir}/small-test-file.wav").prepare_for_training(
+        f"{pcm_dir}/prepared.sph"
+    )
+    assert read_header(sph.location) == dict(header, data_offset=1024)
+    cut_utterance(sph.location, f"{pcm_dir}/cut.sph", 0.765, 2.881)
+    with map_pcm(f"{pcm_dir}/cut.sph") as data:
+        assert data == pcm[765 * 32 : 2881 * 32]
+
+    shutil.rmtree(pcm_dir)
+
+
 if __name__ == "__main__":
     import sys
 
@@ -7,6 +7,9 @@ import shutil
 from os.path import join as pjoin
 
 from asrtoolkit.data_structures.corpus import corpus
+from asrtoolkit.data_structures.manifest import manifest_location, read_manifest
+from asrtoolkit.file_utils.common_file_operations import FILE_HASHES
+from asrtoolkit.file_utils.name_cleaners import basename
 from asrtoolkit.split_corpus import split_corpus
 from utils import get_sample_dir, get_test_dir
 
@@ -30,6 +33,15 @@ def setup_test_corpus(orig_dir, trn_dir, dev_dir, n_exemplars):
         )
 
 
+def set_speakers(corpus_dir, i, speakers):
+    """ Replace the speaker of each segment in a test transcript """
+    with open(pjoin(corpus_dir, "file-{:02d}.stm".format(i))) as f:
+        lines = f.read().splitlines()
+    with open(pjoin(corpus_dir, "file-{:02d}.stm".format(i)), "w") as f:
+        for line, speaker in zip(lines, speakers):
+            f.write(line.replace("gk_speaker", speaker) + "\n")
+
+
 def validate_split(directory, inds):
     """ Validate the files were split as expected """
     assert set(os.listdir(directory)) == {
@@ -73,6 +85,422 @@ def test_split_corpus():
     assert dev_corpus.validate()
 
 
+def test_corpus_defers_transcript_parsing():
+    """ Test corpus discovery does not parse transcripts """
+    corpus_dir = f"{test_dir}/deferred-corpus"
+    setup_test_corpus(corpus_dir, corpus_dir, corpus_dir, 2)
+
+    c = corpus({"location": corpus_dir})
+    assert all(_.transcript_file.deferred for _ in c.exemplars)
+    assert c.exemplars[0].transcript_file.hash()
+    assert c.exemplars[0].transcript_file.deferred
+
+    assert c.exemplars[0].count_words() == 10
+    assert not c.exemplars[0].transcript_file.deferred
+    assert c.exemplars[1].transcript_file.deferred
+
+    shutil.rmtree(corpus_dir)
+
+
+def test_corpus_discovery_layouts():
+    """ Test discovery over flat, nested, and sharded layouts """
+    corpus_dir = f"{test_dir}/layout-corpus"
+    setup_test_corpus(corpus_dir, corpus_dir, corpus_dir, 2)
+    for shard in ["shard-0", "shard-1"]:
+        for subdirectory, ext in [("sph", "mp3"), ("stm", "stm")]:
+            os.makedirs(pjoin(corpus_dir, shard, subdirectory), exist_ok=True)
+            shutil.copy(
+                f"{test_dir}/small-test-file.{ext}",
+                pjoin(corpus_dir, shard, subdirectory, f"{shard}.{ext}"),
+            )
+
+    flat = corpus({"location": corpus_dir})
+    assert len(flat.exemplars) == 2
+
+    sharded = corpus({"location": corpus_dir, "recursive": True, "discovery_jobs": 2})
+    assert sorted(basename(_.audio_file.location) for _ in sharded.exemplars) == [
+        "file-00.mp3",
+        "file-01.mp3",
+        "shard-0.mp3",
+        "shard-1.mp3",
+    ]
+    assert all(_.validate() for _ in sharded.exemplars)
+
+    shutil.rmtree(corpus_dir)
+
+
+def test_corpus_subtraction():
+    """ Test corpus subtraction matches exemplars by audio file """
+    corpus_dir = f"{test_dir}/subtraction-corpus"
+    setup_test_corpus(corpus_dir, corpus_dir, corpus_dir, 4)
+
+    c = corpus({"location": corpus_dir})
+    rediscovered = corpus({"location": corpus_dir})
+    assert c.exemplars[0] == rediscovered.exemplars[0]
+    assert len(set(c.exemplars + rediscovered.exemplars)) == 4
+
+    remaining = c - rediscovered[1:3]
+    assert remaining.exemplars == [c.exemplars[0], c.exemplars[3]]
+    c -= rediscovered
+    assert c.exemplars == []
+
+    shutil.rmtree(corpus_dir)
+
+
+def test_corpus_split_quotas():
+    """ Test seeded corpus splits meet word, segment, and duration quotas """
+    corpus_dir = f"{test_dir}/quota-corpus"
+    setup_test_corpus(corpus_dir, corpus_dir, corpus_dir, 10)
+    c = corpus({"location": corpus_dir})
+
+    remaining, split = c.split(19, min_segments=1, seed=1337)
+    assert len(split.exemplars) == 2
+    assert len(remaining.exemplars) == 8
+    assert set(split.exemplars).isdisjoint(remaining.exemplars)
+    assert c.split(19, min_segments=1, seed=1337)[1].exemplars == split.exemplars
+
+    # each exemplar has about 4.07 seconds of speech
+    remaining, split = c.split(0, min_segments=1, split_duration=12.0, seed=1337)
+    assert len(split.exemplars) == 3
+
+    shutil.rmtree(corpus_dir)
+
+
+def test_stratified_split():
+    """ Test stratified splits keep speakers on one side and meet quotas """
+    corpus_dir = f"{test_dir}/stratified-corpus"
+    setup_test_corpus(corpus_dir, corpus_dir, corpus_dir, 8)
+    # files 0-3 are linked through speakers 0 and 1, then 4-5 and 6-7 share a speaker
+    for i in range(8):
+        speakers = ["spk{}".format(i // 2)] * 2
+        if i == 0:
+            speakers[1] = "spk1"
+        set_speakers(corpus_dir, i, speakers)
+
+    c = corpus({"location": corpus_dir})
+    splits = c.stratified_split({"dev": 0.25, "train": 0.75}, weight="words", seed=1)
+    assert len(splits["dev"].exemplars) == 2
+    assert len(splits["train"].exemplars) == 6
+    dev_speakers, train_speakers = (
+        {s for eg in splits[_].exemplars for s in eg.list_speakers()}
+        for _ in ["dev", "train"]
+    )
+    assert dev_speakers.isdisjoint(train_speakers)
+    assert {"spk0", "spk1"} <= train_speakers
+
+    shutil.rmtree(corpus_dir)
+
+
+def test_speaker_disjoint_split_single_speaker():
+    """ Test a corpus with one speaker is never divided between splits """
+    import pytest
+
+    from asrtoolkit.prepare_audio_corpora import auto_split_corpora
+    from asrtoolkit.split_corpus import speaker_disjoint_split
+
+    corpus_dir = f"{test_dir}/single-speaker-corpus"
+    setup_test_corpus(corpus_dir, corpus_dir, corpus_dir, 4)
+    for i in range(4):
+        set_speakers(corpus_dir, i, ["spk"] * 2)
+        with open(pjoin(corpus_dir, "file-{:02d}.mp3".format(i)), "ab") as f:
+            f.write(bytes(i))
+
+    c = corpus({"location": corpus_dir})
+    splits = c.stratified_split({"dev": 0.25, "train": 0.75}, seed=1)
+    assert len(splits["train"].exemplars) == 4
+    # an empty split does not rediscover the files at its location
+    assert splits["dev"].exemplars == []
+
+    remaining, split = speaker_disjoint_split(c, 30, 1, weight="segments")
+    assert (len(remaining.exemplars), len(split.exemplars)) == (0, 4)
+    for split_words in [-1, 1000]:
+        with pytest.raises(ValueError):
+            speaker_disjoint_split(c, split_words, 1)
+    with pytest.raises(ValueError):
+        speaker_disjoint_split(c, 10, 1, split_duration=1000)
+
+    corpora = {"train": c, "dev": corpus(), "test": corpus()}
+    with pytest.raises(Exception, match="insufficient data"):
+        auto_split_corpora(corpora, min_size=1, speaker_disjoint=True)
+    assert corpora["dev"].exemplars == []
+
+    shutil.rmtree(corpus_dir)
+
+
+def test_speaker_disjoint_auto_split():
+    """ Test automatic splits keep speakers within one split """
+    from asrtoolkit.prepare_audio_corpora import auto_split_corpora
+
+    corpus_dir = f"{test_dir}/speaker-auto-split-corpus"
+    setup_test_corpus(corpus_dir, corpus_dir, corpus_dir, 10)
+    for i in range(10):
+        set_speakers(corpus_dir, i, ["spk{}".format(i // 2)] * 2)
+        with open(pjoin(corpus_dir, "file-{:02d}.mp3".format(i)), "ab") as f:
+            f.write(bytes(i))
+    corpora = {
+        "train": corpus({"location": corpus_dir}),
+        "dev": corpus(),
+        "test": corpus(),
+    }
+
+    corpora = auto_split_corpora(corpora, min_size=3, speaker_disjoint=True)
+    speakers = [
+        {s for eg in corpora[_].exemplars for s in eg.list_speakers()}
+        for _ in ["train", "dev", "test"]
+    ]
+    assert sum(map(len, speakers)) == len(set.union(*speakers)) == 5
+    assert sum(len(corpora[_].exemplars) for _ in ["train", "dev", "test"]) == 10
+    assert corpora["dev"].calculate_number_of_segments() >= 3
+
+    shutil.rmtree(corpus_dir)
+
+
+def test_auto_split_corpora():
+    """ Test automatic train, dev, and test splits """
+    from asrtoolkit.prepare_audio_corpora import auto_split_corpora
+
+    corpus_dir = f"{test_dir}/auto-split-corpus"
+    setup_test_corpus(corpus_dir, corpus_dir, corpus_dir, 10)
+    # validation removes duplicate audio, so make each file unique
+    for i in range(10):
+        with open(pjoin(corpus_dir, "file-{:02d}.mp3".format(i)), "ab") as f:
+            f.write(bytes(i))
+    corpora = {
+        "train": corpus({"location": corpus_dir}),
+        "dev": corpus(),
+        "test": corpus(),
+    }
+
+    corpora = auto_split_corpora(corpora, min_size=3)
+    assert [len(corpora[_].exemplars) for _ in ["train", "dev", "test"]] == [6, 2, 2]
+
+    # seeded splits are shuffled reproducibly
+    seeded_splits = []
+    for _ in range(2):
+        corpora = {
+            "train": corpus({"location": corpus_dir}),
+            "dev": corpus(),
+            "test": corpus(),
+        }
+        corpora = auto_split_corpora(corpora, min_size=3, seed=7)
+        seeded_splits.append(
+            [
+                [eg.audio_file.location for eg in corpora[_].exemplars]
+                for _ in ["train", "dev", "test"]
+            ]
+        )
+    assert seeded_splits[0] == seeded_splits[1]
+    assert sum(seeded_splits[0], []) != sorted(sum(seeded_splits[0], []))
+
+    shutil.rmtree(corpus_dir)
+
+
+def test_corpus_manifest():
+    """ Test corpus stats are stored in and reused from a manifest """
+    corpus_dir = f"{test_dir}/manifest-corpus"
+    setup_test_corpus(corpus_dir, corpus_dir, corpus_dir, 3)
+
+    first = corpus({"location": corpus_dir, "use_manifest": True})
+    records = read_manifest(corpus_dir)
+    assert len(records) == 3
+    assert all(_["n_words"] == 10 and _["n_segments"] == 2 for _ in records.values())
+    assert all(
+        _["audio_file_hash"] and _["transcript_file_hash"] for _ in records.values()
+    )
+
+    manifest_mtime = os.path.getmtime(manifest_location(corpus_dir))
+    second = corpus({"location": corpus_dir, "use_manifest": True})
+    assert [_.n_words for _ in second.exemplars] == [10, 10, 10]
+    assert all(_.transcript_file.deferred for _ in second.exemplars)
+    assert os.path.getmtime(manifest_location(corpus_dir)) == manifest_mtime
+    # hashes are restored from the manifest rather than computed again
+    FILE_HASHES.clear()
+    second = corpus({"location": corpus_dir, "use_manifest": True})
+    assert len(FILE_HASHES) == 6
+    assert [_.audio_file.hash() for _ in second.exemplars] == [
+        _["audio_file_hash"] for _ in records.values()
+    ]
+    assert len(FILE_HASHES) == 6
+    assert second.count_exemplar_words()[1] == first.count_exemplar_words()[1]
+
+    # changed transcripts are counted again
+    with open(pjoin(corpus_dir, "file-00.stm"), "a") as f:
+        f.write("file-00 1 gk_speaker 7.0 8.0 <o,f0,male> eleven\n")
+    corpus({"location": corpus_dir, "use_manifest": True})
+    assert read_manifest(corpus_dir)[pjoin(corpus_dir, "file-00.mp3")]["n_words"] == 11
+
+    shutil.rmtree(corpus_dir)
+
+
+def test_resume_prepare_for_training(monkeypatch):
+    """ Test exemplars recorded in the preparation journal are not prepared again """
+    import functools
+    import json
+
+    from asrtoolkit.data_structures.manifest import (
+        append_journal,
+        journal_key,
+        log_writer,
+    )
+    from asrtoolkit.file_utils import common_file_operations
+
+    corpus_dir = f"{test_dir}/resume-corpus"
+    target_dir = pjoin(corpus_dir, "prepared")
+    setup_test_corpus(corpus_dir, target_dir, target_dir, 2)
+    # the corpus log deduplicates by audio hash, so make each file unique
+    with open(pjoin(corpus_dir, "file-01.mp3"), "ab") as f:
+        f.write(b"\0")
+    c = corpus({"location": corpus_dir})
+
+    # stand in for a previous run which prepared both exemplars
+    for i, eg in enumerate(c.exemplars):
+        shutil.copy(eg.audio_file.location, pjoin(target_dir, "file-0{}.sph".format(i)))
+        shutil.copy(eg.transcript_file.location, target_dir)
+        prepared = corpus({"location": target_dir}).exemplars[i]
+        prepared.count_segments()
+        key = journal_key(eg, sample_rate=16000, nested=False)
+        append_journal(target_dir, key, prepared, eg)
+
+    # sources and outputs are not hashed again when resuming
+    FILE_HASHES.clear()
+    hashed = []
+    sha1_file = common_file_operations.sha1_file
+    monkeypatch.setattr(
+        common_file_operations,
+        "sha1_file",
+        lambda *args, **kwargs: hashed.append(args) or sha1_file(*args, **kwargs),
+    )
+    c = corpus({"location": corpus_dir})
+    log = c.prepare_for_training(target_dir, resume=True)
+    assert sorted(basename(_["audio_file"]) for _ in log.values()) == [
+        "file-00.sph",
+        "file-01.sph",
+    ]
+    assert hashed == []
+
+    # records are streamed to a log as exemplars complete
+    with log_writer(pjoin(target_dir, "corpora.jsonl")) as log:
+        c.prepare_for_training(
+            target_dir, resume=True, log=functools.partial(log.write, split="train")
+        )
+    with open(pjoin(target_dir, "corpora.jsonl")) as f:
+        records = [json.loads(line) for line in f]
+    assert [basename(_["audio_file"]) for _ in records] == ["file-00.sph", "file-01.sph"]
+    assert records[0]["split"] == "train"
+
+    shutil.rmtree(corpus_dir)
+
+
+def test_shards():
+    """ Test shards partition a corpus and shard logs merge without overlap """
+    import json
+
+    import pytest
+
+    from asrtoolkit.data_structures.manifest import log_record, log_writer
+    from asrtoolkit.prepare_audio_corpora import merge_shard_logs
+
+    corpus_dir = f"{test_dir}/shard-corpus"
+    setup_test_corpus(corpus_dir, corpus_dir, corpus_dir, 10)
+    # logs skip duplicate audio, so make each file unique
+    for i in range(10):
+        with open(pjoin(corpus_dir, "file-{:02d}.mp3".format(i)), "ab") as f:
+            f.write(bytes(i))
+    c = corpus({"location": corpus_dir})
+
+    shards = [c.shard(i, 3) for i in range(3)]
+    locations = [eg.audio_file.location for shard in shards for eg in shard.exemplars]
+    assert sorted(locations) == sorted(eg.audio_file.location for eg in c.exemplars)
+    assert [_.exemplars for _ in shards] == [c.shard(i, 3).exemplars for i in range(3)]
+    with pytest.raises(ValueError):
+        c.shard(3, 3)
+
+    for i, shard in enumerate(shards):
+        with log_writer(pjoin(corpus_dir, "corpora.shard-{}-of-3.jsonl".format(i))) as log:
+            for eg in shard.exemplars:
+                log.write(eg, split="train")
+    # a line truncated by a crash is ignored
+    with open(pjoin(corpus_dir, "corpora.shard-1-of-3.jsonl"), "a") as f:
+        f.write('{"split": "tr')
+    # duplicate audio is not logged twice
+    with log_writer(pjoin(corpus_dir, "duplicates.jsonl")) as log:
+        assert log.write(c.exemplars[0])
+        assert not log.write(c.exemplars[0], split="dev")
+    assert merge_shard_logs(corpus_dir, 3) == 10
+    with open(pjoin(corpus_dir, "corpora.jsonl")) as f:
+        merged = [json.loads(line) for line in f]
+    assert sorted(_["audio_file"] for _ in merged) == sorted(locations)
+    assert {_["split"] for _ in merged} == {"train"}
+
+    # an exemplar prepared by two shards is an error
+    with open(pjoin(corpus_dir, "corpora.shard-0-of-3.jsonl"), "a") as f:
+        f.write(json.dumps(log_record(c.exemplars[0], split="dev")) + "\n")
+    with open(pjoin(corpus_dir, "corpora.shard-1-of-3.jsonl"), "a") as f:
+        f.write("\n" + json.dumps(log_record(c.exemplars[0], split="dev")) + "\n")
+    with pytest.raises(ValueError, match="prepared by shards"):
+        merge_shard_logs(corpus_dir, 3)
+    with pytest.raises(ValueError, match="missing"):
+        merge_shard_logs(corpus_dir, 4)
+
+    shutil.rmtree(corpus_dir)
+
+
+def test_gather_deduplicates_corpora():
+    """ Test audio shared between corpora is only gathered once, kept in test """
+    from asrtoolkit.prepare_audio_corpora import gather_all_corpora
+
+    corpus_dirs = [f"{test_dir}/dedupe-corpus-a", f"{test_dir}/dedupe-corpus-b"]
+    setup_test_corpus(pjoin(corpus_dirs[0], "test"), corpus_dirs[0], corpus_dirs[0], 2)
+    setup_test_corpus(pjoin(corpus_dirs[1], "train"), corpus_dirs[1], corpus_dirs[1], 3)
+    # only file-00 of corpus b's training data duplicates corpus a's test data
+    for corpus_dir, split, i in [
+        (corpus_dirs[0], "test", 1),
+        (corpus_dirs[1], "train", 1),
+        (corpus_dirs[1], "train", 2),
+    ]:
+        with open(pjoin(corpus_dir, split, "file-{:02d}.mp3".format(i)), "ab") as f:
+            f.write(bytes(i) + split.encode())
+
+    corpora = gather_all_corpora(corpus_dirs)
+    assert len(corpora["test"].exemplars) == 2
+    assert [basename(eg.audio_file.location) for eg in corpora["train"].exemplars] == [
+        "file-01.mp3",
+        "file-02.mp3",
+    ]
+    assert len(gather_all_corpora(corpus_dirs, dedupe=False)["train"].exemplars) == 3
+
+    for corpus_dir in corpus_dirs:
+        shutil.rmtree(corpus_dir)
+
+
+def test_corpus_stats(monkeypatch):
+    """ Test corpus stats are counted once and cached in the manifest """
+    from asrtoolkit.data_structures import corpus as corpus_module
+
+    corpus_dir = f"{test_dir}/stats-corpus"
+    setup_test_corpus(corpus_dir, corpus_dir, corpus_dir, 3)
+    set_speakers(corpus_dir, 2, ["spk", "spk"])
+    c = corpus({"location": corpus_dir, "use_manifest": True})
+
+    stats = c.stats(vocab=["one", "two"], bins=2, processes=0)
+    assert stats["files"] == 3
+    assert stats["words"] == sum(eg.count_words() for eg in c.exemplars)
+    assert stats["segments"] == 6
+    assert round(stats["duration"], 2) == round(3 * c.exemplars[0].speech_duration(), 2)
+    assert stats["speakers"] == ["gk_speaker", "spk"]
+    assert stats["histograms"]["segments"]["counts"] == [3, 0]
+    # each transcript counts from one to ten
+    assert stats["distinct_words"] == 10
+    assert stats["oov_rate"] == stats["oov_distinct_rate"] == 0.8
+
+    # cached stats are reused without reading transcripts
+    monkeypatch.setattr(corpus_module, "transcript_stats", None)
+    c = corpus({"location": corpus_dir, "use_manifest": True})
+    assert c.stats(vocab=["one", "two"], bins=2) == stats
+
+    shutil.rmtree(corpus_dir)
+
+
 if __name__ == "__main__":
     import sys
 
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Test time-range queries on transcripts
+"""
+
+from asrtoolkit.data_structures.time_aligned_text import time_aligned_text
+from utils import get_sample_dir
+
+sample_dir = get_sample_dir(__file__)
+
+
+def test_time_range_queries():
+    " execute time-range query tests against a linear scan "
+
+    transcript = time_aligned_text(f"{sample_dir}/BillGatesTEDTalk_transcribed.stm")
+
+    t0, t1 = 1312.5, 1340.0
+    expected = [
+        seg
+        for seg in transcript.segments
+        if float(seg.start) < t1 and float(seg.stop) > t0
+    ]
+    assert expected
+    assert transcript.segments_between(t0, t1) == expected
+
+    seg = transcript.segment_at(t0)
+    assert float(seg.start) <= t0 < float(seg.stop)
+    assert transcript.segment_at(-1.0) is None
+
+    pairs = transcript.overlaps(transcript)
+    assert all(a is b for a, b in pairs)
+    assert len(pairs) == len(transcript.segments)
+
+
+def test_time_range_queries_with_long_segments():
+    " check queries against a linear scan when long segments enclose short ones "
+    from asrtoolkit.data_structures.interval_index import interval_index
+    from asrtoolkit.data_structures.segment import segment
+
+    segments = [
+        segment(start=s / 2, stop=s / 2 + 1 + (s % 7) * (s % 5) * 10, text=str(s))
+        for s in range(200)
+    ] + [segment(start=5.0, stop=5.0, text="empty")]
+    index = interval_index(segments)
+    for t0, t1 in [(0.0, 0.25), (5.0, 6.0), (40.0, 41.0), (99.9, 150.0), (300, 400)]:
+        expected = sorted(
+            (_ for _ in segments if _.start < t1 and _.stop > t0),
+            key=lambda _: (_.start, _.stop, segments.index(_)),
+        )
+        assert index.between(t0, t1) == expected
+        containing = [_ for _ in expected if _.start <= t0]
+        assert index.at(t0) is (containing[-1] if containing else None)
+
+
+if __name__ == "__main__":
+    import sys
+
+    import pytest
+
+    pytest.main(sys.argv)